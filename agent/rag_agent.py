@@ -8,23 +8,29 @@ Tools:
   - WebSearchTool         : built-in SDK web-search hosted tool
 
 The agent is instantiated once at module level and re-used per request
-with a per-request RunContextWrapper that carries `chat_id` and a DB session.
+with a per-request RunContextWrapper that carries `chat_id`. The SDK may run
+tool calls concurrently, so each tool opens its own AsyncSession.
+
+`direct_agent` is the tool-less variant used by the single-pass "direct"
+chat mode (see llm/chatmodel.py): the server retrieves documents and history
+itself and the model answers in one structured-output call.
 """
 
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 
 from agents import Agent, RunContextWrapper, WebSearchTool, function_tool
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
 from sqlalchemy import select
 
 from db.data_models import Message
+from db.database import asyncSessionLocal
 from models.pymodel import LLMResponseFormat
-from retriver.retriver import similarityretriver
+from retriver.retriver import RetrievedChunk, similarityretriver
+from utils.metrics import stage
 
 load_dotenv()
 
@@ -35,7 +41,13 @@ load_dotenv()
 class RAGContext:
     """Holds per-request state that tools need (which chat to query)."""
     chat_id: int
-    db: Session
+    # Every chunk search_knowledge_base returned during the run, in order, once
+    # each, with its id, metadata, ranking score and cosine distance
+    retrieved: list[RetrievedChunk] = field(default_factory=list)
+
+    def add_retrieved(self, chunks: list[RetrievedChunk]) -> None:
+        seen = {chunk.id for chunk in self.retrieved}
+        self.retrieved.extend(chunk for chunk in chunks if chunk.id not in seen)
 
 
 # ── Function Tools ────────────────────────────────────────────────────────────
@@ -51,14 +63,15 @@ async def search_knowledge_base(ctx: RunContextWrapper[RAGContext], query: str)
         query: The search query to look up in the knowledge base.
     """
     chat_id = ctx.context.chat_id
-    db = ctx.context.db
 
-    # Use similarityretriver — NOTE: this does NOT close db since we pass the
-    # shared session; db.close() in retriver.py only runs when called standalone.
-    results = await similarityretriver(question=query, chat_id=chat_id, k=5, db=db)
+    with stage("tool", "search_knowledge_base"):
+        async with asyncSessionLocal() as db:
+            results = await similarityretriver(question=query, chat_id=chat_id, k=5, db=db)
 
     if not results:
         return "No relevant documents found in the knowledge base."
+    # Citations are built from what the model actually saw
+    ctx.context.add_retrieved(results)
 
     chunks = []
     for i, doc in enumerate(results):
@@ -71,8 +84,31 @@ async def search_knowledge_base(ctx: RunContextWrapper[RAGContext], query: str)
     return "\n\n".join(chunks)
 
 
+async def fetch_chat_history(chat_id: int, limit: int = 10) -> str:
+    """The chat's last `limit` messages in chronological order, or "" if there are none."""
+    async with asyncSessionLocal() as db:
+        messages = (await db.scalars(
+            select(Message)
+            .where(Message.chat_id == chat_id)
+            .order_by(Message.message_id.desc())
+            .limit(limit)
+        )).all()
+
+    # Reverse to chronological order
+    return "\n\n".join(
+        f"[{msg.role.capitalize()}]: {msg.content}"
+        for msg in reversed(messages)
+    )
+
+
+def format_citation(filename: str, page: int, excerpt: str, topic: str | None = None) -> str:
+    year = datetime.now().year
+    label = f"[{topic}] " if topic else ""
+    return f'{label}"{excerpt}" — {filename}, p. {page} (Uploaded document, {year})'
+
+
 @function_tool
-def search_chat_history(ctx: RunContextWrapper[RAGContext], query: str) -> str:
+async def search_chat_history(ctx: RunContextWrapper[RAGContext], query: str) -> str:
     """
     Search the conversation history for past Q&A pairs relevant to the current
     query. Use this to maintain context and avoid repeating explanations.
@@ -81,27 +117,11 @@ def search_chat_history(ctx: RunContextWrapper[RAGContext], query: str) -> str:
     Args:
         query: The search query to look up in previous conversations.
     """
-    chat_id = ctx.context.chat_id
-    db = ctx.context.db
-
     # Fetch the last 10 messages (user + assistant) for context
-    messages = db.scalars(
-        select(Message)
-        .where(Message.chat_id == chat_id)
-        .order_by(Message.message_id.desc())
-        .limit(10)
-    ).all()
+    with stage("tool", "search_chat_history"):
+        history = await fetch_chat_history(ctx.context.chat_id)
 
-    if not messages:
-        return "No relevant information found in past conversations."
-
-    # Reverse to chronological order
-    messages = list(reversed(messages))
-    chunks = [
-        f"[{msg.role.capitalize()}]: {msg.content}"
-        for msg in messages
-    ]
-    return "\n\n".join(chunks)
+    return history or "No relevant information found in past conversations."
 
 
 @function_tool
@@ -123,14 +143,8 @@ def generate_citation(
         topic:    A brief label describing what this citation supports
                   (e.g. "Definition of Photosynthesis").
     """
-    year = datetime.now().year
-    citation = (
-        f"[{topic}] "
-        f'"{excerpt}" '
-        f"— {filename}, p. {page} "
-        f"(Uploaded document, {year})"
-    )
-    return citation
+    with stage("tool", "generate_citation"):
+        return format_citation(filename, page, excerpt, topic)
 
 
 # ── System Prompt ─────────────────────────────────────────────────────────────
@@ -268,3 +282,37 @@ rag_agent: Agent[RAGContext] = Agent(
     ],
     output_type=LLMResponseFormat,
 )
+
+
+# ── Direct (single-pass) mode ─────────────────────────────────────────────────
+
+DIRECT_SYSTEM_PROMPT = """\
+You are an expert teaching assistant that helps users understand and learn from \
+the documents they have uploaded.
+
+The user's message contains numbered excerpts from their uploaded documents, \
+the recent conversation and their question. Answer from these excerpts:
+
+• Treat the document excerpts as the primary and most authoritative source.
+• Use the conversation to keep context and avoid repeating explanations.
+• Stay factually accurate and never invent facts. If the excerpts do not \
+contain the answer, say so honestly and set confidence_level accordingly.
+• Begin with a concise direct answer, then explain the reasoning and the \
+important details. Use bullet points and examples when they help.
+
+In `sources_cited`, list only the numbers of the excerpts you actually used \
+(for example ["1", "3"]); full citations are added for you.
+
+Do not mention excerpts, retrieval or any implementation details in the answer.
+
+Return ONLY valid JSON that matches the required output schema.
+No markdown fences.
+No additional text outside the JSON object.
+"""
+
+direct_agent: Agent[RAGContext] = Agent(
+    name="RAG Teaching Assistant (direct)",
+    instructions=DIRECT_SYSTEM_PROMPT,
+    model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    output_type=LLMResponseFormat,
+)
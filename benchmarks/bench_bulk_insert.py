@@ -0,0 +1,82 @@
+"""
+Benchmark DocumentChunk write paths (rows/sec).
+
+Inserts the same synthetic rows through every method in db/bulk.py
+(orm, executemany, copy) into a throw-away chat, commits after each batch
+like ingestion does, then deletes everything it wrote.
+
+Usage (needs DATABASE_URI pointing at a pgvector database):
+    python -m benchmarks.bench_bulk_insert --rows 5000 --batch 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from db.bulk import bulk_insert_chunks
+from db.data_models import Chat, DocumentChunk, Users
+from db.database import sessionLocal
+
+METHODS = ["orm", "executemany", "copy"]
+
+
+def make_rows(chat_id: int, count: int, dim: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            "chat_id": chat_id,
+            "content": f"benchmark chunk {i} " + "lorem ipsum dolor sit amet " * 18,
+            "doc_metadata": {"source": "benchmark.pdf", "page": i // 10},
+            "embedding": [rng.uniform(-1, 1) for _ in range(dim)],
+        }
+        for i in range(count)
+    ]
+
+
+def run(method: str, rows: list[dict], batch: int) -> float:
+    db = sessionLocal()
+    try:
+        start = time.perf_counter()
+        for i in range(0, len(rows), batch):
+            bulk_insert_chunks(db, rows[i:i + batch], method=method)
+            db.commit()
+        return len(rows) / (time.perf_counter() - start)
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    db = sessionLocal()
+    user = Users(user_name="bench", email="bench@example.invalid")
+    db.add(user)
+    db.flush()
+    chat = Chat(chat_name="bulk insert benchmark", chat_fileloc="bench", user_id=user.user_id)
+    db.add(chat)
+    db.commit()
+
+    try:
+        rows = make_rows(chat.chat_id, args.rows, 768, args.seed)
+        print(f"{args.rows} rows, batch {args.batch}")
+        baseline = None
+        for method in METHODS:
+            rate = run(method, rows, args.batch)
+            baseline = baseline or rate
+            print(f"  {method:<12} {rate:>10.0f} rows/s   x{rate / baseline:.1f}")
+    finally:
+        db.query(DocumentChunk).filter(DocumentChunk.chat_id == chat.chat_id).delete(synchronize_session=False)
+        db.delete(chat)
+        db.delete(user)
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
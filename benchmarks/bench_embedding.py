@@ -0,0 +1,120 @@
+"""
+Benchmark embedding backends against the PyTorch reference.
+
+Embeds the same fixed corpus with every backend in retriver/embedding.py and
+reports, per backend:
+  - throughput    texts/s when embedding the corpus in batches (ingestion)
+  - latency       p50 / p95 of single-text calls (query embedding)
+  - agreement     mean and minimum cosine similarity to the torch vectors
+
+The corpus is deterministic synthetic course text, or the chunks of the PDFs
+in --pdf-dir (split like ingestion does). No database is needed.
+
+Usage:
+    python -m benchmarks.bench_embedding --texts 512 --batch 32
+    python -m benchmarks.bench_embedding --pdf-dir ./some_pdfs --onnx-file onnx/model.onnx
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+from retriver.embedding import (
+    EMBED_INTRA_OP_THREADS,
+    MODEL_NAME,
+    ONNX_MODEL_FILE,
+    OnnxBackend,
+    TorchBackend,
+)
+
+TOPICS = ["photosynthesis", "eigenvalues", "TCP congestion control", "the Krebs cycle",
+          "Fourier transforms", "supply and demand", "Newton's second law", "SQL joins"]
+PHRASES = ["is defined as", "can be derived from", "is closely related to", "is measured by",
+           "depends on", "was first described in", "is used to explain", "differs from"]
+
+
+def synthetic_corpus(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        sentences = [
+            f"{rng.choice(TOPICS).capitalize()} {rng.choice(PHRASES)} {rng.choice(TOPICS)}."
+            for _ in range(rng.randint(3, 12))
+        ]
+        corpus.append(f"Section {i}. " + " ".join(sentences))
+    return corpus
+
+
+def pdf_corpus(pdf_dir: Path, count: int) -> list[str]:
+    from retriver.pdf_parser import iter_pages
+    from retriver.text_spilter import text_splitter
+
+    texts = []
+    for page in iter_pages(pdf_dir):
+        texts.extend(chunk.page_content for chunk in text_splitter.split_documents([page]))
+        if len(texts) >= count:
+            break
+    return texts[:count]
+
+
+def measure(backend, corpus: list[str], batch: int, queries: int) -> tuple[np.ndarray, float, list[float]]:
+    backend.embed_documents(corpus[:batch])  # warm-up
+
+    start = time.perf_counter()
+    vectors = []
+    for i in range(0, len(corpus), batch):
+        vectors.extend(backend.embed_documents(corpus[i:i + batch]))
+    throughput = len(corpus) / (time.perf_counter() - start)
+
+    latencies = []
+    for text in corpus[:queries]:
+        start = time.perf_counter()
+        backend.embed_query(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.asarray(vectors, dtype=np.float32), throughput, latencies
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pdf-dir", type=Path)
+    parser.add_argument("--onnx-file", action="append",
+                        help=f"ONNX file(s) to compare (default {ONNX_MODEL_FILE}); repeatable")
+    parser.add_argument("--threads", type=int, default=EMBED_INTRA_OP_THREADS,
+                        help="ONNX Runtime intra-op threads (0 = one per core)")
+    args = parser.parse_args()
+
+    corpus = pdf_corpus(args.pdf_dir, args.texts) if args.pdf_dir else synthetic_corpus(args.texts, args.seed)
+    print(f"{MODEL_NAME}: {len(corpus)} texts, batch {args.batch}, {args.queries} single queries")
+
+    backends = [("torch", lambda: TorchBackend(MODEL_NAME))]
+    for file_name in args.onnx_file or [ONNX_MODEL_FILE]:
+        backends.append((f"onnx {file_name}", lambda f=file_name: OnnxBackend(MODEL_NAME, f, args.threads)))
+
+    reference = None
+    print(f"  {'backend':<42} {'texts/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'cos mean':>9} {'cos min':>8}")
+    for label, load in backends:
+        vectors, throughput, latencies = measure(load(), corpus, args.batch, args.queries)
+        if reference is None:
+            reference = vectors
+        cosine = cosine_rows(vectors, reference)
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"  {label:<42} {throughput:>9.1f} {statistics.median(latencies):>8.2f} {p95:>8.2f} "
+              f"{cosine.mean():>9.5f} {cosine.min():>8.5f}")
+
+
+if __name__ == "__main__":
+    main()
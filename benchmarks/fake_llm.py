@@ -0,0 +1,159 @@
+"""
+Deterministic stand-in for the OpenAI models behind the Agents SDK.
+
+`FakeModelProvider` is installed through llm.chatmodel.set_run_config, so the
+real agents, tools, retrieval and storage all run; only the model calls are
+replaced. Every call sleeps FAKE_MODEL_LATENCY_MS (default 200) to stand in
+for network + generation time, then:
+
+  - agent mode, first call : calls search_knowledge_base with the question
+  - agent mode, after tools: answers from the tool output
+  - direct mode (no tools) : answers from the excerpts, citing excerpts 1 and 2
+
+Answers are valid LLMResponseFormat JSON built only from the input, so the
+same request always produces the same answer. Streaming yields the answer
+JSON in FAKE_MODEL_STREAM_CHUNKS pieces spread over the same latency.
+
+Usage:
+    from agents import RunConfig
+    from llm.chatmodel import set_run_config
+    set_run_config(RunConfig(model_provider=FakeModelProvider(), tracing_disabled=True))
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from typing import AsyncIterator, Optional
+
+from agents import Model, ModelProvider, ModelResponse, Usage
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+)
+
+FAKE_MODEL_LATENCY_MS = float(os.getenv("FAKE_MODEL_LATENCY_MS", "200"))
+FAKE_MODEL_STREAM_CHUNKS = int(os.getenv("FAKE_MODEL_STREAM_CHUNKS", "20"))
+
+SEARCH_TOOL = "search_knowledge_base"
+
+
+def _item_field(item, name: str):
+    return item.get(name) if isinstance(item, dict) else getattr(item, name, None)
+
+
+def _text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return " ".join(str(_item_field(part, "text") or "") for part in content or [])
+
+
+def _question(items: list) -> str:
+    text = ""
+    for item in items:
+        if _item_field(item, "role") == "user":
+            text = _text_of(_item_field(item, "content"))
+    match = re.search(r"User question:\s*(.*)", text, re.S)
+    return (match.group(1) if match else text).strip()
+
+
+def _answer(question: str, context: str, cited: Optional[list[str]]) -> str:
+    words = re.sub(r"\[[^\]]*\]", " ", context).split()
+    summary = " ".join(words[:60]) or "The uploaded documents do not cover this."
+    return json.dumps({
+        "answer": f"{question}\n\n{summary}",
+        "key_points": [" ".join(words[i:i + 8]) for i in range(0, min(len(words), 24), 8)],
+        "confidence_level": "high" if words else "low",
+        "sources_cited": cited,
+        "needs_clarification": False,
+        "clarification_needed": None,
+        "follow_up_suggestions": [f"Tell me more about {question.rstrip('?')}"],
+    })
+
+
+def _call_id(*parts: str) -> str:
+    return "call_" + hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+
+class FakeModel(Model):
+    def __init__(self, latency_ms: float, stream_chunks: int):
+        self.latency = latency_ms / 1000
+        self.stream_chunks = max(1, stream_chunks)
+
+    def _output(self, input, tools) -> list:
+        items = [{"role": "user", "content": input}] if isinstance(input, str) else list(input)
+        question = _question(items)
+        tool_outputs = [str(_item_field(item, "output")) for item in items
+                        if _item_field(item, "type") == "function_call_output"]
+        tool_names = {getattr(tool, "name", None) for tool in tools or []}
+
+        if SEARCH_TOOL in tool_names and not tool_outputs:
+            return [ResponseFunctionToolCall(
+                type="function_call",
+                id=_call_id("fc", question),
+                call_id=_call_id(question),
+                name=SEARCH_TOOL,
+                arguments=json.dumps({"query": question}),
+                status="completed",
+            )]
+
+        if tool_names:
+            text = _answer(question, "\n".join(tool_outputs), None)
+        else:  # direct mode: the excerpts are in the user message
+            prompt = _text_of(_item_field(items[-1], "content")) if items else ""
+            excerpts = prompt.split("Recent conversation:")[0]
+            text = _answer(question, excerpts, ["1", "2"])
+        return [ResponseOutputMessage(
+            type="message",
+            id=_call_id("msg", question),
+            role="assistant",
+            status="completed",
+            content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+        )]
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema,
+                           handoffs, tracing, *args, **kwargs) -> ModelResponse:
+        await asyncio.sleep(self.latency)
+        return ModelResponse(output=self._output(input, tools), usage=Usage(), response_id=None)
+
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema,
+                              handoffs, tracing, *args, **kwargs) -> AsyncIterator:
+        output = self._output(input, tools)
+        sequence = 0
+        if isinstance(output[0], ResponseOutputMessage):
+            text = output[0].content[0].text
+            size = -(-len(text) // self.stream_chunks)
+            for start in range(0, len(text), size):
+                await asyncio.sleep(self.latency / self.stream_chunks)
+                yield ResponseTextDeltaEvent.model_construct(
+                    type="response.output_text.delta",
+                    item_id=output[0].id,
+                    output_index=0,
+                    content_index=0,
+                    delta=text[start:start + size],
+                    logprobs=[],
+                    sequence_number=sequence,
+                )
+                sequence += 1
+        else:
+            await asyncio.sleep(self.latency)
+        yield ResponseCompletedEvent.model_construct(
+            type="response.completed",
+            response=Response.model_construct(id=_call_id("resp", str(sequence)), output=output, usage=None),
+            sequence_number=sequence,
+        )
+
+
+class FakeModelProvider(ModelProvider):
+    def __init__(self, latency_ms: float = FAKE_MODEL_LATENCY_MS, stream_chunks: int = FAKE_MODEL_STREAM_CHUNKS):
+        self._model = FakeModel(latency_ms, stream_chunks)
+
+    def get_model(self, model_name: Optional[str]) -> Model:
+        return self._model
@@ -0,0 +1,424 @@
+"""
+Offline load test for /upload-pdfs and /chat.
+
+Starts benchmarks.loadtest_app (the real app with the fake model provider of
+benchmarks/fake_llm.py) under uvicorn with STORAGE_BACKEND=local, so no
+OpenAI or Supabase calls are made; DATABASE_URI must point at a local
+Postgres with pgvector. Then:
+
+  1. signs up / logs in a benchmark user
+  2. uploads --uploads synthetic PDFs (--pages pages each), --concurrency at
+     a time, and waits for each ingestion job to complete
+  3. sends --warmup untimed and --requests timed /chat requests spread over
+     the uploaded chats, --concurrency at a time
+  4. deletes the chats it created (unless --keep)
+
+and reports latency p50 / p95 / p99 and throughput for uploads, ingestion
+jobs and chat, plus the per-stage breakdown from the server's
+rag_stage_duration_seconds histogram and the answer / retrieval cache hit
+rates from rag_answer_cache_total and rag_retrieval_cache_total (scraped
+from /metrics before and after the chat phase).
+
+Questions are drawn from a small set of templates and topics, so most of them
+repeat within a chat. The server it starts therefore runs with
+ANSWER_CACHE_ENABLED=false unless that is set explicitly; otherwise the chat
+phase would mostly measure answer-cache hits.
+
+PDFs, questions and fake answers are derived from --seed and the fake model
+sleeps a fixed FAKE_MODEL_LATENCY_MS, so runs with the same arguments are
+comparable. Save a run with --out and compare against it with --compare:
+
+    python -m benchmarks.loadtest --requests 200 --concurrency 16 --out baseline.json
+    python -m benchmarks.loadtest --requests 200 --concurrency 16 --compare baseline.json
+
+--compare exits with status 1 when a p95 latency grows (or throughput drops)
+by more than --tolerance (default 10%). --url runs against a server that is
+already running loadtest_app instead of starting one.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.bench_embedding import TOPICS, synthetic_corpus
+
+QUESTIONS = ["What is {}?", "Explain {} with an example.", "How does {} work?",
+             "Summarize what the notes say about {}.", "Why does {} matter?",
+             "What are the key points of {}?"]
+STAGE_METRIC = "rag_stage_duration_seconds"
+CACHE_METRICS = {"rag_answer_cache": "answer_cache", "rag_retrieval_cache": "retrieval_cache"}
+
+
+# ── Synthetic inputs ──────────────────────────────────────────────────────────
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: list[str]) -> bytes:
+    """A minimal PDF with one page of Helvetica text per string."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        words, lines, line = text.split(), [], ""
+        for word in words:
+            if len(line) + len(word) > 90:
+                lines.append(line)
+                line = ""
+            line = f"{line} {word}".strip()
+        lines.append(line)
+        stream = "BT /F1 10 Tf 12 TL 50 780 Td " + " ".join(f"({_pdf_escape(l)}) '" for l in lines[:60]) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def make_questions(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    return [rng.choice(QUESTIONS).format(rng.choice(TOPICS)) for _ in range(count)]
+
+
+# ── Measurement ───────────────────────────────────────────────────────────────
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    """Latency percentiles (ms) and throughput (requests/s) of one phase."""
+    if not latencies:
+        return {"count": 0, "errors": errors}
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "p50_ms": round(cuts[49] * 1000, 2),
+        "p95_ms": round(cuts[94] * 1000, 2),
+        "p99_ms": round(cuts[98] * 1000, 2),
+    }
+
+
+def scrape_stages(text: str) -> dict:
+    """{"component/stage": {"count", "sum", "buckets": {le: cumulative count}}} from /metrics."""
+    stages: dict = {}
+    for family in text_string_to_metric_families(text):
+        if family.name != STAGE_METRIC:
+            continue
+        for sample in family.samples:
+            key = f"{sample.labels['component']}/{sample.labels['stage']}"
+            entry = stages.setdefault(key, {"count": 0.0, "sum": 0.0, "buckets": {}})
+            if sample.name.endswith("_bucket"):
+                entry["buckets"][float(sample.labels["le"])] = sample.value
+            elif sample.name.endswith("_count"):
+                entry["count"] = sample.value
+            elif sample.name.endswith("_sum"):
+                entry["sum"] = sample.value
+    return stages
+
+
+def stage_breakdown(before: dict, after: dict) -> dict:
+    """Per-stage count, mean and bucket-estimated p95 (ms) between two scrapes."""
+    breakdown = {}
+    for key, end in sorted(after.items()):
+        start = before.get(key, {"count": 0.0, "sum": 0.0, "buckets": {}})
+        count = end["count"] - start["count"]
+        if count <= 0:
+            continue
+        p95 = None
+        for le in sorted(end["buckets"]):
+            if end["buckets"][le] - start["buckets"].get(le, 0.0) >= 0.95 * count:
+                p95 = le
+                break
+        breakdown[key] = {
+            "count": int(count),
+            "mean_ms": round((end["sum"] - start["sum"]) / count * 1000, 2),
+            "p95_le_ms": None if p95 in (None, float("inf")) else p95 * 1000,
+        }
+    return breakdown
+
+
+def scrape_caches(text: str) -> dict:
+    """{"answer_cache": {result: count}, "retrieval_cache": {...}} from /metrics."""
+    caches: dict = {name: {} for name in CACHE_METRICS.values()}
+    for family in text_string_to_metric_families(text):
+        name = CACHE_METRICS.get(family.name.removesuffix("_total"))
+        if name is None:
+            continue
+        for sample in family.samples:
+            if sample.name.endswith("_total"):
+                caches[name][sample.labels["result"]] = sample.value
+    return caches
+
+
+def cache_breakdown(before: dict, after: dict) -> dict:
+    """Per-cache lookup counts by result and hit rate (%) between two scrapes."""
+    breakdown = {}
+    for name, end in after.items():
+        counts = {result: int(value - before.get(name, {}).get(result, 0.0)) for result, value in end.items()}
+        lookups = sum(counts.values())
+        breakdown[name] = {
+            **counts,
+            "lookups": lookups,
+            "hit_rate_pct": round(counts.get("hit", 0) / lookups * 100, 1) if lookups else None,
+        }
+    return breakdown
+
+
+# ── Traffic ───────────────────────────────────────────────────────────────────
+
+async def login(client: httpx.AsyncClient, email: str) -> None:
+    credentials = {"email": email, "password": "loadtest-password"}
+    response = await client.post("/signup", json={"user_name": "loadtest", **credentials})
+    if response.status_code not in (200, 409):
+        response.raise_for_status()
+    response = await client.post("/login", json=credentials)
+    response.raise_for_status()
+    client.headers["Authorization"] = f"Bearer {response.json()['User']['token']}"
+
+
+async def upload(client: httpx.AsyncClient, index: int, pages: int, seed: int) -> tuple[int, float, float]:
+    """Upload one PDF; return (chat_id, upload seconds, seconds until ingestion completed)."""
+    pdf = make_pdf(synthetic_corpus(pages, seed + index))
+    start = time.perf_counter()
+    response = await client.post("/upload-pdfs", files={"files": (f"loadtest-{index}.pdf", pdf, "application/pdf")})
+    response.raise_for_status()
+    uploaded = time.perf_counter() - start
+    body = response.json()
+
+    while True:
+        status = (await client.get(f"/ingest/{body['job_id']}")).json()
+        if status["phase"] == "completed":
+            return body["chat_id"], uploaded, time.perf_counter() - start
+        if status["phase"] == "failed":
+            raise RuntimeError(f"ingestion failed: {status}")
+        await asyncio.sleep(0.1)
+
+
+async def chat(client: httpx.AsyncClient, chat_id: int, question: str, mode: Optional[str]) -> float:
+    start = time.perf_counter()
+    response = await client.post("/chat", json={"chat_id": chat_id, "question": question,
+                                                "chat_history": [], "mode": mode})
+    response.raise_for_status()
+    if not response.json()["success"]:
+        raise RuntimeError(response.json()["error_message"])
+    return time.perf_counter() - start
+
+
+async def run_phase(calls: list, concurrency: int) -> dict:
+    """Run coroutine factories `concurrency` at a time; summarize their latencies."""
+    latencies, errors, results = [], 0, []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(call):
+        nonlocal errors
+        async with limit:
+            try:
+                results.append(await call())
+            except Exception as e:
+                errors += 1
+                print(f"  error: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(call) for call in calls))
+    return {"elapsed": time.perf_counter() - start, "errors": errors, "results": results}
+
+
+async def drive(args, base_url: str) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+        await login(client, f"loadtest-{args.seed}@example.com")
+
+        print(f"uploading {args.uploads} PDFs x {args.pages} pages...")
+        uploads = await run_phase(
+            [lambda i=i: upload(client, i, args.pages, args.seed) for i in range(args.uploads)], args.concurrency
+        )
+        chat_ids = sorted(chat_id for chat_id, _, _ in uploads["results"])
+        if not chat_ids:
+            raise SystemExit("no upload succeeded")
+
+        questions = make_questions(args.warmup + args.requests, args.seed)
+        calls = [lambda i=i: chat(client, chat_ids[i % len(chat_ids)], questions[i], args.mode)
+                 for i in range(len(questions))]
+        print(f"warming up with {args.warmup} chat requests...")
+        await run_phase(calls[:args.warmup], args.concurrency)
+
+        before = (await client.get("/metrics")).text
+        print(f"sending {args.requests} chat requests, {args.concurrency} concurrent...")
+        chats = await run_phase(calls[args.warmup:], args.concurrency)
+        after = (await client.get("/metrics")).text
+
+        if not args.keep:
+            for chat_id in chat_ids:
+                await client.delete("/deletechat", params={"chatid": chat_id})
+
+    return {
+        "upload": summarize([u for _, u, _ in uploads["results"]], uploads["errors"], uploads["elapsed"]),
+        "ingest": summarize([t for _, _, t in uploads["results"]], uploads["errors"], uploads["elapsed"]),
+        "chat": summarize(chats["results"], chats["errors"], chats["elapsed"]),
+        "stages": stage_breakdown(scrape_stages(before), scrape_stages(after)),
+        "caches": cache_breakdown(scrape_caches(before), scrape_caches(after)),
+    }
+
+
+# ── Server ────────────────────────────────────────────────────────────────────
+
+def start_server(port: int, storage_dir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("STORAGE_BACKEND", "local")
+    env.setdefault("LOCAL_STORAGE_DIR", storage_dir)
+    # The question set repeats; cached answers would hide the chat path being measured
+    env.setdefault("ANSWER_CACHE_ENABLED", "false")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.loadtest_app:app",
+         "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base_url: str, timeout: float, server: Optional[subprocess.Popen]) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=5) as client:
+        while time.monotonic() < deadline:
+            if server is not None and server.poll() is not None:
+                raise SystemExit(f"server exited with status {server.returncode}")
+            try:
+                if (await client.get("/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise SystemExit(f"server at {base_url} not ready after {timeout:.0f}s")
+
+
+# ── Reporting ─────────────────────────────────────────────────────────────────
+
+def print_report(results: dict) -> None:
+    print(f"\n  {'phase':<8} {'count':>6} {'errors':>6} {'req/s':>8} {'mean ms':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for phase in ("upload", "ingest", "chat"):
+        s = results[phase]
+        if not s.get("count"):
+            print(f"  {phase:<8} {0:>6} {s['errors']:>6}")
+            continue
+        print(f"  {phase:<8} {s['count']:>6} {s['errors']:>6} {s['throughput']:>8.2f} {s['mean_ms']:>9.1f} "
+              f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+
+    print(f"\n  {'stage (chat phase)':<36} {'count':>6} {'mean ms':>9} {'p95 ≤ ms':>9}")
+    for key, s in results["stages"].items():
+        p95 = f"{s['p95_le_ms']:>9.0f}" if s["p95_le_ms"] is not None else f"{'>max':>9}"
+        print(f"  {key:<36} {s['count']:>6} {s['mean_ms']:>9.1f} {p95}")
+
+    print(f"\n  {'cache (chat phase)':<36} {'lookups':>7} {'hit':>6} {'miss':>6} {'stale':>6} {'hit %':>6}")
+    for name, s in results["caches"].items():
+        rate = f"{s['hit_rate_pct']:>6.1f}" if s["hit_rate_pct"] is not None else f"{'-':>6}"
+        print(f"  {name:<36} {s['lookups']:>7} {s.get('hit', 0):>6} {s.get('miss', 0):>6} {s.get('stale', 0):>6} {rate}")
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> bool:
+    """Print changes against a baseline; True if any regression exceeds the tolerance."""
+    if baseline.get("config") != current.get("config"):
+        print("\nWarning: baseline was recorded with different arguments; deltas may not be comparable")
+    regressed = False
+    print(f"\n  {'metric':<36} {'baseline':>10} {'current':>10} {'change':>8}")
+
+    def row(label: str, old, new, higher_is_better: bool = False, gate: bool = False) -> None:
+        nonlocal regressed
+        if old is None or new is None or old == 0:
+            return
+        change = (new - old) / old
+        worse = gate and (change < -tolerance if higher_is_better else change > tolerance)
+        regressed |= worse
+        print(f"  {label:<36} {old:>10.1f} {new:>10.1f} {change:>+8.1%}{'  REGRESSION' if worse else ''}")
+
+    # p95 latency and throughput gate the exit status; the rest is context
+    for phase in ("upload", "ingest", "chat"):
+        old, new = baseline.get(phase, {}), current.get(phase, {})
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            row(f"{phase} {metric}", old.get(metric), new.get(metric), gate=metric == "p95_ms")
+        row(f"{phase} throughput", old.get("throughput"), new.get("throughput"), higher_is_better=True, gate=True)
+    for key, new in current["stages"].items():
+        old = baseline.get("stages", {}).get(key)
+        if old:
+            row(f"{key} mean_ms", old["mean_ms"], new["mean_ms"])
+    for name, new in current.get("caches", {}).items():
+        old = baseline.get("caches", {}).get(name, {})
+        row(f"{name} hit_rate_pct", old.get("hit_rate_pct"), new["hit_rate_pct"], higher_is_better=True)
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=["agent", "direct"], help="ChatRequest.mode (default: server CHAT_MODE)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="use a running loadtest_app server instead of starting one")
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark chats")
+    parser.add_argument("--out", type=Path, help="write results as JSON")
+    parser.add_argument("--compare", type=Path, help="baseline JSON from an earlier --out")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    config = {k: getattr(args, k) for k in ("uploads", "pages", "requests", "warmup", "concurrency", "mode", "seed")}
+    config["fake_model_latency_ms"] = float(os.getenv("FAKE_MODEL_LATENCY_MS", "200"))
+
+    server = None
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    with tempfile.TemporaryDirectory(prefix="loadtest-storage-") as storage_dir:
+        if not args.url:
+            server = start_server(args.port, storage_dir)
+        try:
+            asyncio.run(wait_ready(base_url, args.ready_timeout, server))
+            results = asyncio.run(drive(args, base_url))
+        finally:
+            if server:
+                server.terminate()
+                server.wait(timeout=30)
+
+    results = {
+        "config": config,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        **results,
+    }
+    print_report(results)
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2))
+        print(f"\nresults written to {args.out}")
+    if args.compare:
+        if compare(json.loads(args.compare.read_text()), results, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""
+The FastAPI app with the fake model provider installed, for load tests.
+
+    uvicorn benchmarks.loadtest_app:app
+
+Everything but the model calls is real: set STORAGE_BACKEND=local and point
+DATABASE_URI at a local Postgres with pgvector (benchmarks/loadtest.py does
+the former for you).
+"""
+
+from agents import RunConfig
+
+from benchmarks.fake_llm import FakeModelProvider
+from llm.chatmodel import set_run_config
+from main import app
+
+set_run_config(RunConfig(model_provider=FakeModelProvider(), tracing_disabled=True))
+
+__all__ = ["app"]
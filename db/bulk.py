@@ -0,0 +1,100 @@
+"""
+Bulk write path for `document_chunk` rows.
+
+Adding DocumentChunk objects one by one makes the ORM issue one INSERT per
+row, each carrying a 768-float vector as text. `bulk_insert_chunks` writes a
+whole batch at once instead, using the method in BULK_INSERT_METHOD:
+
+  - copy        (default) binary COPY FROM STDIN; vectors are sent in
+                pgvector's binary wire format, no float → text round trip
+  - executemany multi-row INSERT ... VALUES through SQLAlchemy Core
+  - orm         the original per-object path, kept for benchmarks
+
+Rows are plain dicts with chat_id, content, doc_metadata and embedding.
+The caller owns the transaction and commits.
+
+Benchmark: python -m benchmarks.bench_bulk_insert
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import struct
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from db.data_models import DocumentChunk
+
+BULK_INSERT_METHOD = os.getenv("BULK_INSERT_METHOD", "copy").lower()
+
+COPY_SQL = (
+    "COPY document_chunk (chat_id, content, doc_metadata, embedding) "
+    "FROM STDIN WITH (FORMAT binary)"
+)
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+_NULL = struct.pack(">i", -1)
+
+
+def _field(payload: bytes) -> bytes:
+    return struct.pack(">i", len(payload)) + payload
+
+
+def _encode_vector(vector) -> bytes:
+    # pgvector binary format: int16 dim, int16 unused, dim x float32 (big-endian)
+    dim = len(vector)
+    return struct.pack(f">hh{dim}f", dim, 0, *vector)
+
+
+def _copy_payload(rows: list[dict]) -> io.BytesIO:
+    buf = io.BytesIO()
+    buf.write(_COPY_HEADER)
+    for row in rows:
+        buf.write(struct.pack(">h", 4))
+        buf.write(_field(struct.pack(">i", row["chat_id"])))
+        buf.write(_field(row["content"].encode("utf-8")))
+        metadata = row.get("doc_metadata")
+        # json (not jsonb) uses its text form in binary COPY
+        buf.write(_NULL if metadata is None else _field(json.dumps(metadata).encode("utf-8")))
+        embedding = row.get("embedding")
+        buf.write(_NULL if embedding is None else _field(_encode_vector(embedding)))
+    buf.write(_COPY_TRAILER)
+    buf.seek(0)
+    return buf
+
+
+def _copy_rows(db: Session, rows: list[dict]) -> None:
+    dbapi_conn = db.connection().connection
+    with dbapi_conn.cursor() as cur:
+        cur.copy_expert(COPY_SQL, _copy_payload(rows))
+
+
+def _executemany_rows(db: Session, rows: list[dict]) -> None:
+    db.execute(insert(DocumentChunk), rows)
+
+
+def _orm_rows(db: Session, rows: list[dict]) -> None:
+    for row in rows:
+        db.add(DocumentChunk(**row))
+    db.flush()
+
+
+_METHODS = {
+    "copy": _copy_rows,
+    "executemany": _executemany_rows,
+    "orm": _orm_rows,
+}
+
+
+def bulk_insert_chunks(db: Session, rows: list[dict], method: str | None = None) -> None:
+    """Insert DocumentChunk rows in one round trip (no commit)."""
+    if not rows:
+        return
+    method = method or BULK_INSERT_METHOD
+    if method not in _METHODS:
+        raise ValueError(f"Unknown bulk insert method: {method!r}")
+    _METHODS[method](db, rows)
+
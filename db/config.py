@@ -1,4 +1,4 @@
-from .database import sessionLocal
+from .database import sessionLocal, asyncSessionLocal
 
 def init_db():
     db = sessionLocal()
@@ -6,3 +6,7 @@ def init_db():
         yield db
     finally:
         db.close()
+
+async def init_async_db():
+    async with asyncSessionLocal() as db:
+        yield db
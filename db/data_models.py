@@ -1,5 +1,5 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Integer, String, Column, ForeignKey, JSON,Text
+from sqlalchemy import Integer, String, Column, ForeignKey, JSON,Text,DateTime, inspect, text
 from sqlalchemy.orm import relationship
 from pgvector.sqlalchemy import Vector
 
@@ -37,6 +37,11 @@ class Message(Base):
       - key_points            = list of key bullet points  (JSON array)
       - sources_cited         = list of citation strings   (JSON array)
       - follow_up_suggestions = list of follow-up questions (JSON array)
+      - confidence_level      = "high" / "medium" / "low"
+      - sources               = [{"filename", "page"}] source citations (JSON array)
+
+    The answer cache (retriver/answer_cache.py) serves repeated questions
+    from these assistant messages.
     """
     __tablename__ = "Message"
     message_id = Column(Integer, primary_key=True, index=True)
@@ -48,14 +53,71 @@ class Message(Base):
     key_points = Column(JSON, nullable=True)
     sources_cited = Column(JSON, nullable=True)
     follow_up_suggestions = Column(JSON, nullable=True)
+    confidence_level = Column(String, nullable=True)
+    sources = Column(JSON, nullable=True)
 
     chat = relationship("Chat", back_populates="messages")
 
 class DocumentChunk(Base):
     __tablename__ = "document_chunk"
     id = Column(Integer, primary_key=True, index=True)
-    chat_id = Column(Integer, ForeignKey("Chat.chat_id"), nullable=False)
+    chat_id = Column(Integer, ForeignKey("Chat.chat_id"), nullable=False, index=True)
     content = Column(Text, nullable=False)
     doc_metadata = Column(JSON, nullable=True)   # e.g. {"source": "file.pdf", "page": 3}
-    embedding = Column(Vector(768))  # 768 = all-mpnet-base-v2 dimension
-    chat = relationship("Chat")
\ No newline at end of file
+    embedding = Column(Vector(768))  # 768 = all-mpnet-base-v2 dimension; ANN index managed in db/indexes.py
+    chat = relationship("Chat")
+
+class EmbeddingCache(Base):
+    """
+    Content-addressed store of chunk embeddings, reused across uploads.
+
+    content_hash = SHA-256 hex digest of the chunk text
+    model_id     = embedding model that produced the vector
+    """
+    __tablename__ = "embedding_cache"
+    content_hash = Column(String(64), primary_key=True)
+    model_id = Column(String, primary_key=True)
+    embedding = Column(Vector(768), nullable=False)
+
+class IngestJobRecord(Base):
+    """
+    Status of a background ingestion job (retriver/ingest.py), written by the
+    worker process running it so any uvicorn worker can answer GET /ingest/{job_id}.
+
+    updated_at is refreshed periodically while the job is queued or running;
+    an unfinished job that stops being refreshed was lost with its worker.
+    """
+    __tablename__ = "ingest_job"
+    job_id = Column(String(32), primary_key=True)
+    chat_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+    phase = Column(String, nullable=False)
+    files_total = Column(Integer, default=0)
+    pages_parsed = Column(Integer, default=0)
+    chunks_total = Column(Integer, default=0)
+    chunks_embedded = Column(Integer, default=0)
+    chunks_cached = Column(Integer, default=0)
+    chunks_inserted = Column(Integer, default=0)
+    errors = Column(JSON, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# Columns added to tables that already exist in deployed databases; create_all
+# only creates missing tables, so these are added at startup by upgrade_schema.
+ADDED_COLUMNS = {
+    "Message": {"confidence_level": "VARCHAR", "sources": "JSON"},
+}
+
+
+def upgrade_schema(engine) -> None:
+    """Add any ADDED_COLUMNS an existing table lacks (nullable, so no rewrite)."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            for name, sql_type in columns.items():
+                if name not in existing:
+                    conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS {name} {sql_type}'))
+                    print(f"added column {table}.{name}")
@@ -1,5 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from pgvector.asyncpg import register_vector
 import os
 from dotenv import load_dotenv
 
@@ -9,5 +12,56 @@ DATABASE_URI = os.getenv("DATABASE_URI")
 if not DATABASE_URI:
     raise ValueError("DATABASE_URI is not set. If running locally, check your .env file. If using Docker, ensure docker-compose passes it or set it in the environment.")
 
-engine = create_engine(DATABASE_URI)
+# Connection pools: each engine keeps its own pool in every worker process, so a
+# worker can hold up to DB_POOL_SIZE + DB_MAX_OVERFLOW (async, request handlers)
+# plus SYNC_DB_POOL_SIZE + SYNC_DB_MAX_OVERFLOW (sync) connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+SYNC_DB_POOL_SIZE = int(os.getenv("SYNC_DB_POOL_SIZE", "2"))
+SYNC_DB_MAX_OVERFLOW = int(os.getenv("SYNC_DB_MAX_OVERFLOW", "3"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Upper bound for any single statement issued by request handlers (async engine)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+_pool_options = dict(
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+
+# Sync engine: startup DDL, background ingestion and the remaining sync routes
+engine = create_engine(
+    DATABASE_URI, pool_size=SYNC_DB_POOL_SIZE, max_overflow=SYNC_DB_MAX_OVERFLOW, **_pool_options
+)
 sessionLocal = sessionmaker(autocommit=False,autoflush=False,bind=engine)
+
+
+def _async_url(uri: str):
+    """Same database through asyncpg; asyncpg takes `ssl` instead of libpq's `sslmode`."""
+    url = make_url(uri)
+    query = dict(url.query)
+    sslmode = query.pop("sslmode", None)
+    url = url.set(drivername="postgresql+asyncpg", query=query)
+    return url, sslmode
+
+
+ASYNC_DATABASE_URI, _sslmode = _async_url(os.getenv("ASYNC_DATABASE_URI") or DATABASE_URI)
+
+_connect_args = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+if _sslmode and _sslmode != "disable":
+    _connect_args["ssl"] = _sslmode
+
+# Async engine: used by async route handlers, the retriever and the agent tools
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URI, connect_args=_connect_args,
+    pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, **_pool_options
+)
+asyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _register_vector(dbapi_connection, connection_record):
+    # Binary codec for the pgvector `vector` type on every new asyncpg connection
+    dbapi_connection.run_async(register_vector)
@@ -0,0 +1,259 @@
+"""
+Index management for `document_chunk`.
+
+`create_all` only creates indexes for brand-new tables, so the indexes that
+retrieval depends on are created (idempotently) here at startup:
+
+  - ix_document_chunk_chat_id        : btree on chat_id (every search filters on it)
+  - ix_document_chunk_embedding_hnsw : HNSW cosine index on embedding
+    or ix_document_chunk_embedding_ivfflat when VECTOR_INDEX_TYPE=ivfflat
+    (suffixed _halfvec / _binary for the compact storage modes below)
+  - ix_document_chunk_content_fts    : GIN on to_tsvector(FTS_CONFIG, content),
+                                       used by hybrid retrieval
+
+Build parameters come from the environment:
+    VECTOR_INDEX_TYPE      hnsw | ivfflat | none      (default hnsw)
+    HNSW_M                 graph degree               (default 16)
+    HNSW_EF_CONSTRUCTION   build-time candidate list  (default 64)
+    IVFFLAT_LISTS          number of IVF lists        (default 100)
+    FTS_CONFIG             text search configuration  (default english)
+    VECTOR_STORAGE_MODE    full | halfvec | binary    (default full)
+
+VECTOR_STORAGE_MODE picks what the ANN index stores. `full` indexes the
+float32 embedding. `halfvec` indexes embedding::halfvec(768) (half the size)
+and `binary` indexes binary_quantize(embedding)::bit(768) with Hamming
+distance (1/32 of the size). Both are expression indexes: the table keeps the
+full-precision column, so a compact search fetches RESCORE_CANDIDATES
+candidates through the small index and re-ranks them by exact cosine distance
+(`vector_candidates`).
+
+Query-time settings, applied per search by `apply_search_settings`:
+    HNSW_EF_SEARCH         candidate list size        (default 40)
+    HNSW_ITERATIVE_SCAN    relaxed_order | strict_order (pgvector >= 0.8, default off)
+    IVFFLAT_PROBES         lists probed per query     (default 10)
+    EXACT_SEARCH_MAX_CHUNKS  chats with at most this many chunks are searched
+                             exactly, skipping the ANN index (default 2000)
+    RESCORE_CANDIDATES     candidates rescored in full precision by the
+                           halfvec / binary modes (default 100)
+
+Indexes left INVALID by an interrupted concurrent build are dropped and
+rebuilt. `python -m db.indexes` exits non-zero unless every index is valid.
+
+Changing build parameters needs a rebuild:
+    python -m db.indexes rebuild
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+
+from sqlalchemy import cast, func, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+
+from db.data_models import DocumentChunk
+
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower()
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+VECTOR_STORAGE_MODE = os.getenv("VECTOR_STORAGE_MODE", "full").lower()
+if VECTOR_STORAGE_MODE not in ("full", "halfvec", "binary"):
+    raise ValueError(f"Invalid VECTOR_STORAGE_MODE: {VECTOR_STORAGE_MODE!r}")
+
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "")
+if HNSW_ITERATIVE_SCAN not in ("", "off", "relaxed_order", "strict_order"):
+    raise ValueError(f"Invalid HNSW_ITERATIVE_SCAN: {HNSW_ITERATIVE_SCAN!r}")
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+EXACT_SEARCH_MAX_CHUNKS = int(os.getenv("EXACT_SEARCH_MAX_CHUNKS", "2000"))
+RESCORE_CANDIDATES = int(os.getenv("RESCORE_CANDIDATES", "100"))
+
+# Queries must use the exact same expression for the planner to pick the index
+FTS_CONFIG = os.getenv("FTS_CONFIG", "english")
+if not re.fullmatch(r"[a-z_]+", FTS_CONFIG):
+    raise ValueError(f"Invalid FTS_CONFIG: {FTS_CONFIG!r}")
+FTS_EXPRESSION = f"to_tsvector('{FTS_CONFIG}'::regconfig, content)"
+
+CHAT_ID_INDEX = "ix_document_chunk_chat_id"
+FTS_INDEX = "ix_document_chunk_content_fts"
+EMBEDDING_DIM = 768
+
+# Indexed expression and operator class per storage mode; vector_candidates
+# orders by the same expressions so the planner can use the index.
+STORAGE_EXPRESSIONS = {
+    "full": ("embedding", "vector_cosine_ops"),
+    "halfvec": (f"(embedding::halfvec({EMBEDDING_DIM}))", "halfvec_cosine_ops"),
+    "binary": (f"(binary_quantize(embedding)::bit({EMBEDDING_DIM}))", "bit_hamming_ops"),
+}
+INDEX_PARAMETERS = {
+    "hnsw": f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})",
+    "ivfflat": f"WITH (lists = {IVFFLAT_LISTS})",
+}
+
+
+def vector_index(index_type: str, storage_mode: str) -> tuple[str, str]:
+    """(name, definition) of the vector index for an index type and storage mode."""
+    expression, opclass = STORAGE_EXPRESSIONS[storage_mode]
+    suffix = "" if storage_mode == "full" else f"_{storage_mode}"
+    return (
+        f"ix_document_chunk_embedding_{index_type}{suffix}",
+        f"USING {index_type} ({expression} {opclass}) {INDEX_PARAMETERS[index_type]}",
+    )
+
+
+def _index_statements() -> list[tuple[str, str]]:
+    """(index name, CREATE statement) for every index this module manages."""
+    statements = [
+        (CHAT_ID_INDEX, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {CHAT_ID_INDEX} ON document_chunk (chat_id)"),
+        (FTS_INDEX, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {FTS_INDEX} ON document_chunk USING gin (({FTS_EXPRESSION}))"),
+    ]
+    if VECTOR_INDEX_TYPE in INDEX_PARAMETERS:
+        name, definition = vector_index(VECTOR_INDEX_TYPE, VECTOR_STORAGE_MODE)
+        statements.append((name, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON document_chunk {definition}"))
+    return statements
+
+
+def _index_state(conn, name: str) -> str:
+    """missing | valid | building (a CREATE INDEX is running now) | invalid (a build failed)."""
+    row = conn.execute(text(
+        "SELECT i.indisvalid, EXISTS ("
+        "  SELECT 1 FROM pg_stat_progress_create_index p WHERE p.index_relid = c.oid"
+        ") AS building "
+        "FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    ), {"name": name}).first()
+    if row is None:
+        return "missing"
+    if row.indisvalid:
+        return "valid"
+    return "building" if row.building else "invalid"
+
+
+def ensure_indexes(engine: Engine) -> bool:
+    """
+    Create the retrieval indexes if they are missing. Never blocks writes.
+
+    A CREATE INDEX CONCURRENTLY that died partway leaves an INVALID index that
+    IF NOT EXISTS would skip forever; those are dropped and rebuilt. Returns
+    True when every index is valid afterwards.
+    """
+    all_valid = True
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, statement in _index_statements():
+            try:
+                state = _index_state(conn, name)
+                if state == "building":
+                    # Another worker is building it; dropping would wait for and discard its work
+                    print(f"Warning: index {name} is being built by another session; skipped")
+                    all_valid = False
+                    continue
+                if state == "invalid":
+                    print(f"Warning: index {name} is invalid (interrupted build); rebuilding")
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                if state != "valid":
+                    conn.execute(text(statement))
+                    all_valid &= _index_state(conn, name) == "valid"
+            except Exception as e:
+                # e.g. another worker started building the same index meanwhile
+                print(f"Warning: index creation skipped ({name}): {e}")
+                all_valid = False
+    status = "ensured" if all_valid else "NOT all valid, see warnings above"
+    print(f"document_chunk indexes {status} (vector index: {VECTOR_INDEX_TYPE}, storage: {VECTOR_STORAGE_MODE})")
+    return all_valid
+
+
+def rebuild_vector_index(engine: Engine) -> bool:
+    """Drop every vector index on document_chunk and build the configured one."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for index_type in INDEX_PARAMETERS:
+            for storage_mode in STORAGE_EXPRESSIONS:
+                name, _ = vector_index(index_type, storage_mode)
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    return ensure_indexes(engine)
+
+
+def vector_candidates(chat_id: int, query_vector, n: int, exact: bool = False):
+    """
+    Subquery of (id, distance) for a chat's n nearest chunks, best first, with
+    distance the full-precision cosine distance.
+
+    In the compact storage modes an approximate search first takes
+    max(RESCORE_CANDIDATES, n) candidates by the indexed halfvec / binary
+    expression, then rescores only those against the float32 embedding.
+    Exact searches scan the full-precision column directly.
+    """
+    distance = DocumentChunk.embedding.cosine_distance(query_vector)
+    if exact or VECTOR_STORAGE_MODE == "full":
+        return (
+            select(DocumentChunk.id, distance.label("distance"))
+            .where(DocumentChunk.chat_id == chat_id)
+            .order_by(distance)
+            .limit(n)
+            .subquery("nearest")
+        )
+
+    query = cast(query_vector, Vector(EMBEDDING_DIM))
+    if VECTOR_STORAGE_MODE == "halfvec":
+        compact_distance = cast(DocumentChunk.embedding, HALFVEC(EMBEDDING_DIM)).cosine_distance(
+            cast(query, HALFVEC(EMBEDDING_DIM))
+        )
+    else:
+        compact_distance = cast(func.binary_quantize(DocumentChunk.embedding), BIT(EMBEDDING_DIM)).hamming_distance(
+            cast(func.binary_quantize(query), BIT(EMBEDDING_DIM))
+        )
+    candidates = (
+        select(DocumentChunk.id, DocumentChunk.embedding)
+        .where(DocumentChunk.chat_id == chat_id)
+        .order_by(compact_distance)
+        .limit(max(RESCORE_CANDIDATES, n))
+        .subquery("candidates")
+    )
+    rescored = candidates.c.embedding.cosine_distance(query_vector)
+    return (
+        select(candidates.c.id, rescored.label("distance"))
+        .order_by(rescored)
+        .limit(n)
+        .subquery("nearest")
+    )
+
+
+async def apply_search_settings(db: AsyncSession, exact: bool, k: int) -> None:
+    """
+    Configure the current transaction for an exact or approximate search.
+
+    Exact search disables plain index scans, so the planner filters on the
+    chat_id index (bitmap scan) and sorts the chat's rows by true distance.
+    Approximate search tunes the ANN index's recall/speed trade-off, sized for
+    the rescoring over-fetch in the compact storage modes.
+    """
+    if not exact and VECTOR_STORAGE_MODE != "full":
+        k = max(RESCORE_CANDIDATES, k)
+    if exact:
+        await db.execute(text("SET LOCAL enable_indexscan = off"))
+    elif VECTOR_INDEX_TYPE == "hnsw":
+        await db.execute(text(f"SET LOCAL hnsw.ef_search = {max(HNSW_EF_SEARCH, k)}"))
+        if HNSW_ITERATIVE_SCAN:
+            await db.execute(text(f"SET LOCAL hnsw.iterative_scan = {HNSW_ITERATIVE_SCAN}"))
+    elif VECTOR_INDEX_TYPE == "ivfflat":
+        await db.execute(text(f"SET LOCAL ivfflat.probes = {IVFFLAT_PROBES}"))
+
+
+async def reset_search_settings(db: AsyncSession, exact: bool) -> None:
+    """Undo `apply_search_settings` for the rest of the transaction."""
+    if exact:
+        await db.execute(text("SET LOCAL enable_indexscan = on"))
+
+
+if __name__ == "__main__":
+    from db.database import engine
+
+    if sys.argv[1:] == ["rebuild"]:
+        ok = rebuild_vector_index(engine)
+    else:
+        ok = ensure_indexes(engine)
+    sys.exit(0 if ok else 1)
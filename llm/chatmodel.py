@@ -1,78 +1,299 @@
 """
 LLM response layer — now powered by the OpenAI Agents SDK with pgvector retrieval.
 
+Database access happens in short-lived AsyncSessions opened by the agent tools,
+so no pooled connection is held while the model runs. Source citations come
+from the chunks the tools returned during the run (`RAGContext.retrieved`).
+
+Two modes, chosen per request (`ChatRequest.mode`) or per deployment (CHAT_MODE):
+  - agent  (default) : the tool-calling RAG agent; can search the web
+  - direct           : the server retrieves DIRECT_RAG_K chunks and the recent
+                       history in parallel, packs them into one prompt and makes
+                       a single structured-output call; `sources_cited` is
+                       filled in server-side from the excerpts the model used
+
 Public interface:
-    async def get_response(req: ChatRequest, chat_id: int, db: Session)
+    async def get_response(req: ChatRequest, chat_id: int)
         -> tuple[LLMResponseFormat, list[SourceCitation]]
+
+    async def stream_response(req: ChatRequest, chat_id: int)
+        -> AsyncIterator[tuple[str, dict]]
+        Yields ("tool", ...), ("token", ...) events while the agent runs and a
+        final ("final", {"response": LLMResponseFormat, "sources": [...]}).
+
+    def set_run_config(config: RunConfig | None) -> None
+        RunConfig passed to every run, e.g. to swap in another model provider
+        (benchmarks/fake_llm.py serves deterministic answers for load tests).
 """
 
 from __future__ import annotations
 
+import asyncio
 import os
-from sqlalchemy.orm import Session
+import re
+from typing import AsyncIterator, Optional
 
-from agents import Runner
+from agents import RunConfig, Runner
 from dotenv import load_dotenv
+from openai.types.responses import ResponseTextDeltaEvent
 
-from agent.rag_agent import RAGContext, rag_agent
+from agent.rag_agent import RAGContext, direct_agent, fetch_chat_history, format_citation, rag_agent
+from db.database import asyncSessionLocal
 from models.pymodel import ChatRequest, LLMResponseFormat, SourceCitation
-from retriver.retriver import similarityretriver
+from retriver.retriver import RetrievedChunk, similarityretriver
+from utils.metrics import stage
 
 load_dotenv()
 
+CHAT_MODE = os.getenv("CHAT_MODE", "agent").lower()
+if CHAT_MODE not in ("agent", "direct"):
+    raise ValueError(f"Invalid CHAT_MODE: {CHAT_MODE!r}")
+DIRECT_RAG_K = int(os.getenv("DIRECT_RAG_K", "6"))
 
-async def get_response(req: ChatRequest, chat_id: int, db: Session):
-    """
-    Run the RAG agent for a user question and return a structured response
-    together with source citations pulled from the pgvector document store.
+# None: the SDK defaults (OpenAI models, tracing on)
+_run_config: Optional[RunConfig] = None
 
-    Args:
-        req:      ChatRequest containing question + chat_history
-        chat_id:  The chat ID to scope retrieval to
-        db:       Active SQLAlchemy session
 
-    Returns:
-        (LLMResponseFormat, list[SourceCitation])
-    """
+def set_run_config(config: Optional[RunConfig]) -> None:
+    global _run_config
+    _run_config = config
+
 
-    # ── 1. Build the input message for the agent ──────────────────────────────
+def _build_agent_input(req: ChatRequest) -> str:
     chat_history_str = (
         "\n".join([f"{msg.role}: {msg.content}" for msg in req.chat_history])
         if req.chat_history
         else "No previous chat history."
     )
 
-    agent_input = (
+    return (
         f"Chat history so far:\n{chat_history_str}\n\n"
         f"User question: {req.question}"
     )
 
-    # ── 2. Create per-request context ─────────────────────────────────────────
-    rag_ctx = RAGContext(chat_id=chat_id, db=db)
-
-    # ── 3. Run the agent ──────────────────────────────────────────────────────
-    print("Starting OpenAI Agents SDK run...")
-    result = await Runner.run(
-        rag_agent,
-        input=agent_input,
-        context=rag_ctx,
-    )
-
-    llm_response: LLMResponseFormat = result.final_output
-    print(f"Agent response: {llm_response}")
-
-    # ── 4. Build source citations from pgvector via similarityretriver ────────
-    source_chunks = await similarityretriver(question=req.question, chat_id=chat_id, k=4, db=db)
 
+def _build_citations(chunks: list[RetrievedChunk]) -> list[SourceCitation]:
+    """One SourceCitation per document page among the retrieved chunks, in retrieval order."""
     sources: list[SourceCitation] = []
     seen: set[tuple[str, int]] = set()
-    for chunk in source_chunks:
+    for chunk in chunks:
         meta = chunk.doc_metadata or {}
+        if "page" not in meta:  # stored questions / Q&A pairs, not document pages
+            continue
         filename = os.path.basename(meta.get("source", "unknown"))
         page = meta.get("page", 0) + 1  # convert 0-indexed → 1-indexed
         key = (filename, page)
         if key not in seen:
             seen.add(key)
             sources.append(SourceCitation(filename=filename, page=page))
+    return sources
+
+
+# ── Direct mode ───────────────────────────────────────────────────────────────
+
+def _chunk_label(chunk: RetrievedChunk) -> str:
+    meta = chunk.doc_metadata or {}
+    if "page" not in meta:
+        return "earlier conversation"
+    return f"{os.path.basename(meta.get('source', 'unknown'))}, page {meta['page'] + 1}"
+
+
+def _build_direct_input(req: ChatRequest, chunks: list[RetrievedChunk], history: str) -> str:
+    excerpts = "\n\n".join(
+        f"[{i}] ({_chunk_label(chunk)})\n{chunk.content}"
+        for i, chunk in enumerate(chunks, start=1)
+    ) or "No relevant excerpts were found in the uploaded documents."
+
+    return (
+        f"Document excerpts:\n{excerpts}\n\n"
+        f"Recent conversation:\n{history or 'No previous conversation.'}\n\n"
+        f"User question: {req.question}"
+    )
+
+
+async def _prepare_direct(req: ChatRequest, chat_id: int) -> tuple[str, RAGContext]:
+    """Retrieve documents and history concurrently and pack them into one prompt."""
+    async def documents():
+        async with asyncSessionLocal() as db:
+            return await similarityretriver(question=req.question, chat_id=chat_id, k=DIRECT_RAG_K, db=db)
+
+    with stage("llm", "direct_context"):
+        chunks, history = await asyncio.gather(documents(), fetch_chat_history(chat_id))
+
+    rag_ctx = RAGContext(chat_id=chat_id)
+    rag_ctx.add_retrieved(chunks)
+    return _build_direct_input(req, rag_ctx.retrieved, history), rag_ctx
+
+
+def _apply_server_citations(llm_response: LLMResponseFormat, chunks: list[RetrievedChunk]) -> list[RetrievedChunk]:
+    """
+    Replace the excerpt numbers the model listed in `sources_cited` with
+    formatted citations; return the cited chunks (all chunks if none were cited).
+    """
+    cited: list[RetrievedChunk] = []
+    for entry in llm_response.sources_cited or []:
+        for number in re.findall(r"\d+", entry):
+            index = int(number) - 1
+            if 0 <= index < len(chunks) and chunks[index] not in cited:
+                cited.append(chunks[index])
+
+    citations = []
+    for chunk in cited:
+        meta = chunk.doc_metadata or {}
+        if "page" in meta:
+            excerpt = " ".join(chunk.content.split()[:25])
+            citations.append(format_citation(os.path.basename(meta.get("source", "unknown")), meta["page"] + 1, excerpt))
+    llm_response.sources_cited = citations
+    return cited or chunks
+
+
+# ── Running either mode ───────────────────────────────────────────────────────
+
+async def _prepare_run(req: ChatRequest, chat_id: int):
+    """Pick the mode and return (mode, agent, input, context)."""
+    mode = req.mode or CHAT_MODE
+    if mode == "direct":
+        agent_input, rag_ctx = await _prepare_direct(req, chat_id)
+        return mode, direct_agent, agent_input, rag_ctx
+    return mode, rag_agent, _build_agent_input(req), RAGContext(chat_id=chat_id)
+
+
+def _finish_run(mode: str, llm_response: LLMResponseFormat, rag_ctx: RAGContext) -> list[SourceCitation]:
+    chunks = rag_ctx.retrieved
+    if mode == "direct" and llm_response:
+        chunks = _apply_server_citations(llm_response, chunks)
+    return _build_citations(chunks)
+
+
+async def get_response(req: ChatRequest, chat_id: int):
+    """
+    Answer a user question (agent or direct mode) and return a structured
+    response together with source citations pulled from the pgvector document store.
+
+    Args:
+        req:      ChatRequest containing question + chat_history (+ optional mode)
+        chat_id:  The chat ID to scope retrieval to
+
+    Returns:
+        (LLMResponseFormat, list[SourceCitation])
+    """
+
+    # ── 1. Build the input message and per-request context ────────────────────
+    mode, agent, agent_input, rag_ctx = await _prepare_run(req, chat_id)
+
+    # ── 2. Run the agent ──────────────────────────────────────────────────────
+    print(f"Starting OpenAI Agents SDK run ({mode} mode)...")
+    with stage("llm", f"{mode}_run"):
+        result = await Runner.run(
+            agent,
+            input=agent_input,
+            context=rag_ctx,
+            run_config=_run_config,
+        )
+
+    llm_response: LLMResponseFormat = result.final_output
+    print(f"Agent response: {llm_response}")
+
+    # ── 3. Build source citations ─────────────────────────────────────────────
+    sources = _finish_run(mode, llm_response, rag_ctx)
 
     return llm_response, sources
+
+
+# ── Streaming ─────────────────────────────────────────────────────────────────
+
+class _AnswerDeltaExtractor:
+    """
+    Pull the text of the "answer" field out of the streamed structured output.
+
+    The agent streams its final output as raw JSON text; users only want to
+    see the answer being written, not braces and keys. Deltas are fed in as
+    they arrive and the decoded answer characters are returned.
+    """
+
+    _START = re.compile(r'"answer"\s*:\s*"')
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self._buffer = ""       # text seen before the answer string starts
+        self._escape = ""       # pending (possibly split) escape sequence
+        self._high = ""         # high surrogate waiting for its low half
+        self._state = "seek"    # seek → answer → done
+
+    def feed(self, delta: str) -> str:
+        if self._state == "seek":
+            self._buffer += delta
+            match = self._START.search(self._buffer)
+            if not match:
+                return ""
+            delta = self._buffer[match.end():]
+            self._buffer = ""
+            self._state = "answer"
+        if self._state != "answer":
+            return ""
+
+        out = []
+        for ch in delta:
+            if self._escape:
+                self._escape += ch
+                if self._escape[1] == "u":
+                    if len(self._escape) == 6:
+                        code = chr(int(self._escape[2:], 16))
+                        self._escape = ""
+                        if "\ud800" <= code <= "\udbff":
+                            self._high = code
+                        else:
+                            out.append((self._high + code).encode("utf-16", "surrogatepass").decode("utf-16") if self._high else code)
+                            self._high = ""
+                else:
+                    out.append(self._ESCAPES.get(ch, ch))
+                    self._escape = ""
+            elif ch == "\\":
+                self._escape = ch
+            elif ch == '"':
+                self._state = "done"
+                break
+            else:
+                out.append(ch)
+        return "".join(out)
+
+
+async def stream_response(req: ChatRequest, chat_id: int) -> AsyncIterator[tuple[str, dict]]:
+    """
+    Answer a user question (agent or direct mode) with the SDK's streaming runner.
+
+    Yields:
+        ("tool",  {"status": "called", "tool": name})   a tool call was issued
+        ("tool",  {"status": "completed"})               its output came back
+        ("token", {"delta": text})                       answer text as generated
+        ("final", {"response": LLMResponseFormat, "sources": list[SourceCitation]})
+    """
+    mode, agent, agent_input, rag_ctx = await _prepare_run(req, chat_id)
+
+    print(f"Starting OpenAI Agents SDK streamed run ({mode} mode)...")
+    result = Runner.run_streamed(
+        agent,
+        input=agent_input,
+        context=rag_ctx,
+        run_config=_run_config,
+    )
+
+    answer = _AnswerDeltaExtractor()
+    async for event in result.stream_events():
+        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+            text = answer.feed(event.data.delta)
+            if text:
+                yield "token", {"delta": text}
+        elif event.type == "run_item_stream_event":
+            if event.name == "tool_called":
+                raw = event.item.raw_item
+                name = getattr(raw, "name", None) or getattr(raw, "type", "tool")
+                yield "tool", {"status": "called", "tool": name}
+            elif event.name == "tool_output":
+                yield "tool", {"status": "completed"}
+
+    llm_response: LLMResponseFormat = result.final_output
+    print(f"Agent response: {llm_response}")
+
+    sources = _finish_run(mode, llm_response, rag_ctx)
+    yield "final", {"response": llm_response, "sources": sources}
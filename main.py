@@ -1,7 +1,13 @@
-from fastapi import FastAPI,Header,Depends
+import time
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI,Header,Depends,Response
 from fastapi.middleware.cors import CORSMiddleware
-from db.database import engine
+from db.database import engine, async_engine
 from db import data_models
+from db.indexes import ensure_indexes
 from route.chat_route.chat_router import router as chat_router
 from route.upload_route.upload_router import router as upload_router
 from route.auth_route.auth_router import router as auth_router
@@ -9,12 +15,90 @@ from route.auth_route.auth_github_route import router as github_router
 from models.pymodel import userdataforapi
 from typing import Annotated
 from utils.protectroute import get_current_user
-app = FastAPI()
+from utils.storage import close_storage, get_storage
+from utils.upload import drain_uploads
+from retriver.write_behind import write_behind
+from retriver.ingest import fail_orphaned_jobs, shutdown as shutdown_ingest
+from retriver.embedding_cache import query_embedding_cache
+from retriver.embedding_service import embedding_service
+from retriver.pdf_parser import shutdown_pool
+from retriver.reranker import reranker
+from utils.metrics import register_cache_metrics, register_pool_metrics, render
+from utils.startup import startup
+from sqlalchemy import text
+
+
+# ── Startup components (run concurrently by the lifespan) ────────────────────
+
+_schema_created = asyncio.Event()
+
+def _create_schema():
+    # Creating tables in postgrsql
+    data_models.Base.metadata.create_all(bind=engine)
+    data_models.upgrade_schema(engine)
+    print("tables created")
+    # Ingestion jobs left unfinished by a worker that went away
+    orphaned = fail_orphaned_jobs()
+    if orphaned:
+        print(f"marked {orphaned} orphaned ingest job(s) failed")
+
+async def _database_alive() -> bool:
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    return True
+
+async def prepare_database():
+    await asyncio.to_thread(_create_schema)
+    _schema_created.set()
+    await _database_alive()
+
+async def build_indexes():
+    # chat_id + vector (HNSW/IVFFlat) indexes for document_chunk. Not a readiness
+    # component: a concurrent build over a large table can take a long time, and
+    # retrieval works (by sequential scan) until it is done.
+    await _schema_created.wait()
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(ensure_indexes, engine)
+    except Exception as e:
+        print(f"Warning: index build failed: {e}")
+    startup.record("indexes", time.perf_counter() - start)
+
+async def prepare_storage():
+    get_storage()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.record("import", time.perf_counter() - IMPORT_STARTED)
+    # Prometheus: pool state for both engines and query-embedding cache counters
+    register_pool_metrics({"sync": engine, "async": async_engine})
+    register_cache_metrics(query_embedding_cache)
+    # Serve /health right away; /ready reports when these are done
+    starting = asyncio.create_task(startup.run({
+        "database": prepare_database,
+        "embedding_model": embedding_service.warm_up,
+        "storage": prepare_storage,
+    }))
+    indexing = asyncio.create_task(build_indexes())
+    yield
+    starting.cancel()
+    indexing.cancel()
+    # Let durable PDF uploads finish, stop ingestion (unfinished jobs are stored
+    # as failed) and write out queued chat chunks, then release pooled HTTP
+    # connections to object storage and pooled async database connections
+    await drain_uploads()
+    await shutdown_ingest()
+    await write_behind.shutdown()
+    await close_storage()
+    await async_engine.dispose()
+    # Stop the PDF parsing processes and the embedding / reranking threads
+    shutdown_pool()
+    embedding_service.shutdown()
+    if reranker is not None:
+        reranker.shutdown()
 
+app = FastAPI(lifespan=lifespan)
 
-# Creating tables in postgrsql
-data_models.Base.metadata.create_all(bind=engine)
-print("tables created")
 # Enable CORS for your React frontend
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +123,21 @@ def read_root():
 @app.get("/health")
 def cheak_health():
     return {"health":"okay"}
+# Readiness route: 503 until the database, embedding model and storage are live
+@app.get("/ready")
+async def check_ready(response: Response):
+    status = await startup.status({
+        "database": _database_alive,
+        "embedding_model": lambda: embedding_service.ready,
+    })
+    if not status["ready"]:
+        response.status_code = 503
+    return status
+# Prometheus scrape endpoint
+@app.get("/metrics")
+def metrics():
+    data, content_type = render()
+    return Response(content=data, media_type=content_type)
 
 @app.get("/getuserdata")
 def protected_route(user:Annotated[userdataforapi,Depends(get_current_user)]):
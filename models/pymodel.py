@@ -1,5 +1,5 @@
 from pydantic import BaseModel,EmailStr
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 
 # Source citation returned alongside LLM answers
@@ -15,10 +15,15 @@ class ChatRequest(BaseModel):
     chat_id: int
     question: str
     chat_history: List[chat_his]
+    # "agent" (tool-calling, can search the web) or "direct" (single LLM call); default: CHAT_MODE
+    mode: Optional[Literal["agent", "direct"]] = None
 
 # This model is for generating token
 class token_payload(BaseModel):
      userid:int
+     # Profile claims: let get_current_user skip the Users lookup (absent in older tokens)
+     user_name:Optional[str] = None
+     email:Optional[str] = None
 
 # These model is processing create/signup user request
 class create_user_request(BaseModel):
@@ -112,3 +117,19 @@ class ChatResponse(BaseModel):
                         "error_message": None
                   }
             }
+
+
+# Progress of a background ingestion job (GET /ingest/{job_id})
+class IngestJobStatus(BaseModel):
+      job_id: str
+      chat_id: int
+      phase: str  # "queued", "parsing", "embedding", "inserting", "completed", "failed"
+      files_total: int = 0
+      pages_parsed: int = 0
+      chunks_total: int = 0
+      chunks_embedded: int = 0
+      chunks_cached: int = 0  # embeddings reused from the embedding cache
+      chunks_inserted: int = 0
+      errors: List[str] = []
+      created_at: Optional[str] = None
+      finished_at: Optional[str] = None
@@ -0,0 +1,156 @@
+"""
+Semantic answer cache over stored chat turns.
+
+Every /chat turn already stores the user's question as an embedded
+DocumentChunk ({"source": "user"}, embedded from the question alone) and the
+structured answer as the assistant Message. The question chunk now also
+records which Message answered it and how fresh that answer was: the chat's
+documents version and a fingerprint of the conversation it was asked in.
+Before running the model, `lookup_answer` finds the most similar earlier
+question in the same chat and returns its stored answer when:
+
+  - cosine similarity >= ANSWER_CACHE_MIN_SIMILARITY (default 0.95),
+  - the chat's documents version is unchanged, i.e. no document chunks were
+    added or removed since that answer was produced, and
+  - the conversation is the same: the last ANSWER_CACHE_HISTORY_MESSAGES
+    stored messages (default 10, what direct mode shows the model) and the
+    request's chat_history hash to the same fingerprint, so a follow-up such
+    as "and the second one?" is never answered from another context.
+
+The documents version is the number of document-page chunks in the chat;
+stored questions and Q&A pairs (which have no page) do not count.
+ANSWER_CACHE_HISTORY_MESSAGES=0 drops the conversation check, for
+deployments whose questions are self-contained.
+
+ANSWER_CACHE_ENABLED=false turns the lookup off. Lookups are counted in
+rag_answer_cache_total{result} (hit / miss / stale).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.data_models import DocumentChunk, Message
+from db.indexes import apply_search_settings, reset_search_settings
+from models.pymodel import ChatRequest, LLMResponseFormat, SourceCitation
+from retriver.embedding_service import embedding_service
+from utils.metrics import ANSWER_CACHE
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.95"))
+ANSWER_CACHE_HISTORY_MESSAGES = int(os.getenv("ANSWER_CACHE_HISTORY_MESSAGES", "10"))
+
+
+@dataclass
+class CachedAnswer:
+    response: LLMResponseFormat
+    sources: list[SourceCitation]
+    similarity: float
+
+
+@dataclass
+class AnswerFreshness:
+    """What a stored answer is valid for: the chat's documents and conversation."""
+    documents_version: int
+    history: str
+
+
+def answer_metadata(answer_message_id: int, freshness: AnswerFreshness) -> dict:
+    """Metadata stored on the question chunk so later lookups can reuse this answer."""
+    return {
+        "answer_message_id": answer_message_id,
+        "documents_version": freshness.documents_version,
+        "history": freshness.history,
+    }
+
+
+async def _history_fingerprint(db: AsyncSession, req: ChatRequest) -> str:
+    if ANSWER_CACHE_HISTORY_MESSAGES <= 0:
+        return ""
+    recent = (await db.execute(
+        select(Message.role, Message.content)
+        .where(Message.chat_id == req.chat_id)
+        .order_by(Message.message_id.desc())
+        .limit(ANSWER_CACHE_HISTORY_MESSAGES)
+    )).all()
+    digest = hashlib.sha256()
+    for role, content in [*reversed(recent), *((m.role, m.content) for m in req.chat_history)]:
+        digest.update(f"{role}\0{content}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _cached_response(message: Message) -> LLMResponseFormat:
+    return LLMResponseFormat(
+        answer=message.content,
+        key_points=message.key_points or [],
+        confidence_level=message.confidence_level,
+        sources_cited=message.sources_cited or [],
+        follow_up_suggestions=message.follow_up_suggestions or [],
+    )
+
+
+async def lookup_answer(db: AsyncSession, req: ChatRequest) -> tuple[Optional[CachedAnswer], AnswerFreshness]:
+    """
+    Return (cached answer or None, current freshness). The freshness is
+    needed to store the answer for this turn either way.
+    """
+    chat_id = req.chat_id
+    query_vector = await embedding_service.embed_query(req.question)
+    history = await _history_fingerprint(db, req)
+    source = DocumentChunk.doc_metadata["source"].as_string()
+    answer_id = DocumentChunk.doc_metadata["answer_message_id"].as_integer()
+    page = DocumentChunk.doc_metadata["page"].as_string()
+    distance = DocumentChunk.embedding.cosine_distance(query_vector)
+
+    documents_version = (
+        select(func.count())
+        .select_from(DocumentChunk)
+        .where(DocumentChunk.chat_id == chat_id, page.is_not(None))
+    )
+    nearest = (
+        select(
+            documents_version.scalar_subquery().label("documents_version"),
+            DocumentChunk.doc_metadata,
+            distance.label("distance"),
+            Message,
+        )
+        .select_from(DocumentChunk)
+        .join(Message, (Message.message_id == answer_id) & (Message.chat_id == chat_id))
+        .where(DocumentChunk.chat_id == chat_id, source == "user")
+        .order_by(distance)
+        .limit(1)
+    )
+
+    # A chat has few stored questions: scan them exactly instead of via the ANN index
+    await apply_search_settings(db, True, 1)
+    try:
+        row = (await db.execute(nearest)).first()
+        if row is None:  # no answered question in this chat yet
+            version = await db.scalar(documents_version)
+        else:
+            version = row.documents_version
+    finally:
+        await reset_search_settings(db, True)
+    freshness = AnswerFreshness(documents_version=version, history=history)
+
+    if row is None or 1 - row.distance < ANSWER_CACHE_MIN_SIMILARITY:
+        ANSWER_CACHE.labels("miss").inc()
+        return None, freshness
+    meta = row.doc_metadata
+    if meta.get("documents_version") != version or meta.get("history") != history:
+        ANSWER_CACHE.labels("stale").inc()
+        return None, freshness
+
+    ANSWER_CACHE.labels("hit").inc()
+    message = row.Message
+    return CachedAnswer(
+        response=_cached_response(message),
+        sources=[SourceCitation(**source) for source in message.sources or []],
+        similarity=1 - row.distance,
+    ), freshness
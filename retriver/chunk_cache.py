@@ -0,0 +1,80 @@
+"""
+Content-addressed embedding cache for ingestion.
+
+Every upload creates a new chat, so re-uploading the same lecture notes used
+to re-embed every chunk. `embed_chunks` looks the chunk texts up in the
+`embedding_cache` table (SHA-256 of the text + model id) in one bulk query
+and only sends the texts it has never seen to the model. New vectors are
+written back in the caller's transaction.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from db.data_models import EmbeddingCache
+from retriver.embedding import MODEL_ID
+from retriver.embedding_service import embedding_service
+
+# Keep the IN (...) list of a single lookup query to a sane size
+LOOKUP_CHUNK = 1000
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _lookup(db: Session, hashes: list[str]) -> dict:
+    found = {}
+    for start in range(0, len(hashes), LOOKUP_CHUNK):
+        part = hashes[start:start + LOOKUP_CHUNK]
+        rows = db.execute(
+            select(EmbeddingCache.content_hash, EmbeddingCache.embedding)
+            .where(EmbeddingCache.model_id == MODEL_ID)
+            .where(EmbeddingCache.content_hash.in_(part))
+        ).all()
+        found.update({h: vector for h, vector in rows})
+    return found
+
+
+def _store(db: Session, vectors: dict) -> None:
+    """Queue new cache rows; they are committed together with the chunk batch."""
+    if not vectors:
+        return
+    db.execute(
+        insert(EmbeddingCache)
+        .values([
+            {"content_hash": h, "model_id": MODEL_ID, "embedding": vector}
+            for h, vector in vectors.items()
+        ])
+        .on_conflict_do_nothing(index_elements=["content_hash", "model_id"])
+    )
+
+
+async def embed_chunks(texts: list[str], db: Session) -> tuple[list, int]:
+    """
+    Embed `texts`, reusing cached vectors where possible.
+
+    Returns (vectors in input order, number of texts served from the cache).
+    """
+    hashes = [content_hash(t) for t in texts]
+    vectors = await asyncio.to_thread(_lookup, db, list(set(hashes)))
+    cached = sum(1 for h in hashes if h in vectors)
+
+    missing = {}
+    for h, text in zip(hashes, texts):
+        if h not in vectors:
+            missing.setdefault(h, text)
+
+    if missing:
+        new_vectors = await embedding_service.embed_documents(list(missing.values()))
+        fresh = dict(zip(missing.keys(), new_vectors))
+        await asyncio.to_thread(_store, db, fresh)
+        vectors.update(fresh)
+
+    return [vectors[h] for h in hashes], cached
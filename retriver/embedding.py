@@ -1,2 +1,175 @@
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
\ No newline at end of file
+"""
+Embedding model backends.
+
+EMBEDDING_BACKEND selects how all-mpnet-base-v2 is run:
+  - torch (default) : HuggingFaceEmbeddings, full-precision PyTorch
+  - onnx            : ONNX Runtime on CPU through sentence-transformers' ONNX
+                      backend; int8-quantized weights unless ONNX_QUANTIZED=false
+
+Both produce 768-d vectors from the same model, so they can be mixed in one
+table. ONNX options:
+    ONNX_QUANTIZED          use the int8 export (default true)
+    ONNX_MODEL_FILE         ONNX file in the model repo (default: the int8 export
+                            built for this CPU, see `default_onnx_file`, or
+                            onnx/model.onnx when not quantized)
+    EMBED_INTRA_OP_THREADS  ONNX Runtime intra-op threads (default 0 = one per core)
+
+One model instance serves every thread, and its Hugging Face fast tokenizer
+is not thread-safe ("Already borrowed"), so each backend runs one `encode`
+at a time (`_encode_lock`).
+
+Both backends embed `prepare_texts(texts)` (newlines folded into spaces, as
+HuggingFaceEmbeddings does), so the same text gets the same input either way.
+
+Constructing a backend is cheap: the model is loaded on first use, or by the
+startup warm-up in main.py (`EmbeddingService.warm_up`), so importing this
+module no longer costs a model load.
+
+MODEL_ID names model + backend and keys every embedding cache, so vectors from
+different backends are never mixed up in a cache. The torch backend keeps the
+bare model name, which existing cache rows were written with.
+
+Compare backends with: python -m benchmarks.bench_embedding
+"""
+
+import os
+import platform
+import threading
+from abc import ABC, abstractmethod
+
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "true").lower() in ("1", "true", "yes")
+
+
+def _cpu_flags() -> set[str]:
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def default_onnx_file(quantized: bool = ONNX_QUANTIZED) -> str:
+    """
+    The model repo's int8 exports are each built for one instruction set, and
+    the VNNI / AVX-512 ones run slowly or not at all without it. Pick the one
+    this CPU supports; AVX2 is the portable x86 choice.
+    """
+    if not quantized:
+        return "onnx/model.onnx"
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    flags = _cpu_flags()
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    if "avx512f" in flags:
+        return "onnx/model_qint8_avx512.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE") or default_onnx_file()
+EMBED_INTRA_OP_THREADS = int(os.getenv("EMBED_INTRA_OP_THREADS", "0"))
+
+
+def prepare_texts(texts: list[str]) -> list[str]:
+    return [text.replace("\n", " ") for text in texts]
+
+
+class EmbeddingBackend(ABC):
+    """What the embedding service and ingestion need from a model."""
+
+    model_id: str
+
+    def __init__(self):
+        self._model = None
+        self._lock = threading.Lock()
+        # Serializes inference: the shared tokenizer must not be used by two threads at once
+        self._encode_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        """Load the model once; concurrent first callers wait for the same load."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load_model()
+        return self._model
+
+    @abstractmethod
+    def _load_model(self):
+        ...
+
+    @abstractmethod
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        ...
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+class TorchBackend(EmbeddingBackend):
+    def __init__(self, model_name: str):
+        super().__init__()
+        self.model_id = model_name
+        self._model_name = model_name
+
+    def _load_model(self):
+        from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(model_name=self._model_name)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        model = self.load()
+        with self._encode_lock:
+            return model.embed_documents(prepare_texts(texts))
+
+
+class OnnxBackend(EmbeddingBackend):
+    def __init__(self, model_name: str, file_name: str, intra_op_threads: int):
+        super().__init__()
+        self.model_id = f"{model_name}:onnx:{os.path.basename(file_name)}"
+        self._model_name = model_name
+        self._file_name = file_name
+        self._intra_op_threads = intra_op_threads
+
+    def _load_model(self):
+        import onnxruntime
+        from sentence_transformers import SentenceTransformer
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self._intra_op_threads
+        return SentenceTransformer(
+            self._model_name,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={
+                "file_name": self._file_name,
+                "provider": "CPUExecutionProvider",
+                "session_options": options,
+            },
+        )
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        model = self.load()
+        with self._encode_lock:
+            return model.encode(prepare_texts(texts), convert_to_numpy=True).tolist()
+
+
+def load_backend(name: str = EMBEDDING_BACKEND) -> EmbeddingBackend:
+    if name == "torch":
+        return TorchBackend(MODEL_NAME)
+    if name == "onnx":
+        return OnnxBackend(MODEL_NAME, ONNX_MODEL_FILE, EMBED_INTRA_OP_THREADS)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {name!r}")
+
+
+embeddings = load_backend()
+MODEL_ID = embeddings.model_id
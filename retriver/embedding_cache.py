@@ -0,0 +1,109 @@
+"""
+Memoization for query embeddings.
+
+One /chat turn embeds the same question several times (the user-question
+chunk, the agent's knowledge-base search, citation lookup). Two layers make
+sure each distinct text reaches the model only once:
+
+  - request scope : a plain dict bound to the current request through a
+                    ContextVar (see `request_embedding_scope`); tasks spawned
+                    while handling the request share it.
+  - process LRU   : a bounded LRU (`QUERY_EMBED_CACHE_SIZE`, default 2048)
+                    shared by every request in this worker.
+
+Keys are (model id, whitespace-normalized text).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from retriver.embedding import MODEL_ID
+
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+
+CacheKey = tuple[str, str]
+
+_request_cache: ContextVar[Optional[dict]] = ContextVar("request_embedding_cache", default=None)
+
+
+def cache_key(text: str) -> CacheKey:
+    return (MODEL_ID, " ".join(text.split()))
+
+
+@contextmanager
+def request_embedding_scope():
+    """Share query embeddings between everything that runs inside this block."""
+    token = _request_cache.set({})
+    try:
+        yield
+    finally:
+        _request_cache.reset(token)
+
+
+class QueryEmbeddingCache:
+    """Request-scoped dict in front of a thread-safe, bounded LRU."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lru: "OrderedDict[CacheKey, list[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.request_hits = 0
+        self.lru_hits = 0
+        self.misses = 0
+
+    def get(self, key: CacheKey) -> Optional[list[float]]:
+        scoped = _request_cache.get()
+        if scoped is not None and key in scoped:
+            self.request_hits += 1
+            return scoped[key]
+
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.lru_hits += 1
+            else:
+                self.misses += 1
+        if vector is not None and scoped is not None:
+            scoped[key] = vector
+        return vector
+
+    def put(self, key: CacheKey, vector: list[float]) -> None:
+        scoped = _request_cache.get()
+        if scoped is not None:
+            scoped[key] = vector
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def peek(self, key: CacheKey) -> Optional[list[float]]:
+        """Look a vector up without counting the lookup or refreshing its LRU position."""
+        scoped = _request_cache.get()
+        if scoped is not None and key in scoped:
+            return scoped[key]
+        with self._lock:
+            return self._lru.get(key)
+
+    def stats(self) -> dict:
+        lookups = self.request_hits + self.lru_hits + self.misses
+        return {
+            "size": len(self._lru),
+            "maxsize": self.maxsize,
+            "request_hits": self.request_hits,
+            "lru_hits": self.lru_hits,
+            "misses": self.misses,
+            "hit_rate": (self.request_hits + self.lru_hits) / lookups if lookups else 0.0,
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache(QUERY_EMBED_CACHE_SIZE)
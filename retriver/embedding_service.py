@@ -0,0 +1,153 @@
+"""
+Embedding service that keeps model inference off the event loop.
+
+Every forward pass of the sentence-transformers model runs on a dedicated
+thread pool instead of inside the async handler that asked for it. Query
+batches and document batches get separate pools (`EMBED_WORKERS` and
+`EMBED_DOCUMENT_WORKERS`, default 1 each), so a chat question never waits
+behind a multi-second ingestion batch. The two share the model, whose
+tokenizer allows one `encode` at a time, so the document lane embeds its
+batches in slices of `EMBED_DOCUMENT_SLICE` texts (default 16) and a waiting
+query batch runs between two slices.
+
+Concurrent `embed_query` calls are micro-batched: the first call opens a
+window of `EMBED_BATCH_WINDOW_MS` (default 5 ms); every query that arrives
+before the window closes, or until `EMBED_MAX_BATCH` queries are waiting,
+is embedded together in a single `embed_documents` forward pass.
+
+Query embeddings are memoized through `retriver.embedding_cache`, so a text
+already embedded in this request (or recently, in this worker) never reaches
+the model again.
+
+Usage:
+    from retriver.embedding_service import embedding_service
+    vector  = await embedding_service.embed_query("What is osmosis?")
+    vectors = await embedding_service.embed_documents(texts)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+from retriver.embedding import embeddings
+from retriver.embedding_cache import cache_key, query_embedding_cache
+from utils.metrics import EMBED_BATCH_SIZE
+
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+EMBED_DOCUMENT_WORKERS = int(os.getenv("EMBED_DOCUMENT_WORKERS", "1"))
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+EMBED_DOCUMENT_SLICE = int(os.getenv("EMBED_DOCUMENT_SLICE", "16"))
+
+
+class EmbeddingService:
+    """Async front-end for an embeddings model with query micro-batching."""
+
+    def __init__(self, model, workers: int, document_workers: int, batch_window_ms: float, max_batch: int,
+                 document_slice: int):
+        self._model = model
+        self._document_slice = max(1, document_slice)
+        # Query micro-batches only; documents have their own lane
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="embed")
+        self._document_executor = ThreadPoolExecutor(
+            max_workers=max(1, document_workers), thread_name_prefix="embed-docs"
+        )
+        self._batch_window = batch_window_ms / 1000
+        self._max_batch = max(1, max_batch)
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def embed_query(self, text: str) -> list[float]:
+        """Embed one query, sharing a forward pass with any concurrent callers."""
+        key = cache_key(text)
+        cached = query_embedding_cache.get(key)
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._pending.append((text, waiter))
+
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._batch_window, self._flush)
+        vector = await waiter
+        query_embedding_cache.put(key, vector)
+        return vector
+
+    async def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed an already-batched list of texts on the document inference pool."""
+        if not texts:
+            return []
+        EMBED_BATCH_SIZE.labels("documents").observe(len(texts))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._document_executor, self._embed_slices, texts)
+
+    def _embed_slices(self, texts: list[str]) -> list[list[float]]:
+        """Runs on the document pool; the model is free for queries between slices."""
+        vectors: list[list[float]] = []
+        for start in range(0, len(texts), self._document_slice):
+            vectors.extend(self._model.embed_documents(texts[start:start + self._document_slice]))
+            time.sleep(0)  # let a query thread waiting on the model take it
+        return vectors
+
+    async def warm_up(self) -> None:
+        """Load the model and run one forward pass on the inference pool."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._model.load)
+        await loop.run_in_executor(self._executor, self._model.embed_documents, ["warm-up"])
+
+    @property
+    def ready(self) -> bool:
+        return self._model.loaded
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        # Identical questions in the same window are embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        EMBED_BATCH_SIZE.labels("query").observe(len(texts))
+        loop = asyncio.get_running_loop()
+        result = loop.run_in_executor(self._executor, self._model.embed_documents, texts)
+        result.add_done_callback(partial(self._resolve, batch, texts))
+
+    @staticmethod
+    def _resolve(batch, texts, result: asyncio.Future) -> None:
+        if result.cancelled():
+            error = asyncio.CancelledError()
+        else:
+            error = result.exception()
+        vectors = {} if error else dict(zip(texts, result.result()))
+
+        for text, waiter in batch:
+            if waiter.done():  # caller went away
+                continue
+            if error:
+                waiter.set_exception(error)
+            else:
+                waiter.set_result(vectors[text])
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._document_executor.shutdown(wait=False, cancel_futures=True)
+
+
+embedding_service = EmbeddingService(
+    embeddings,
+    workers=EMBED_WORKERS,
+    document_workers=EMBED_DOCUMENT_WORKERS,
+    batch_window_ms=EMBED_BATCH_WINDOW_MS,
+    max_batch=EMBED_MAX_BATCH,
+    document_slice=EMBED_DOCUMENT_SLICE,
+)
@@ -0,0 +1,290 @@
+"""
+Background ingestion jobs for uploaded PDFs.
+
+`/upload-pdfs` no longer parses and embeds inside the HTTP request. Instead it
+registers an `IngestJob` and hands it to a small pool of asyncio workers
+(`INGEST_WORKERS`, default 2). Each worker runs one job at a time; the
+blocking stages of a job (PDF parsing, embedding, inserts) are
+pushed to threads by the job runner so the event loop stays responsive.
+
+Job state is kept in memory by the process running the job and written to
+the `ingest_job` table when the job is queued, starts and finishes, and
+every INGEST_HEARTBEAT_SECONDS (default 15) in between, so `GET /ingest/{job_id}`
+works from any uvicorn worker. The local copy (the most recent
+`INGEST_MAX_JOBS` jobs) is preferred when the poll lands on the same worker.
+
+Jobs live in this process's queue. On a graceful shutdown `shutdown()`
+(called by main.py's lifespan) stops taking jobs, cancels the workers and
+the heartbeat and records every unfinished job as failed. If the process
+dies instead, its rows stop being refreshed; a row not updated for
+INGEST_JOB_STALE_SECONDS (default 120) is reported as failed, and
+`fail_orphaned_jobs` (run at startup) records that failure permanently.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import update
+
+from db.data_models import IngestJobRecord
+from db.database import sessionLocal
+from models.pymodel import IngestJobStatus
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_JOBS = int(os.getenv("INGEST_MAX_JOBS", "1000"))
+INGEST_HEARTBEAT_SECONDS = float(os.getenv("INGEST_HEARTBEAT_SECONDS", "15"))
+INGEST_JOB_STALE_SECONDS = float(os.getenv("INGEST_JOB_STALE_SECONDS", "120"))
+
+LOST_JOB_ERROR = "ingestion worker stopped before the job finished; please upload again"
+
+
+# ── Job state ─────────────────────────────────────────────────────────────────
+
+@dataclass
+class IngestJob:
+    """
+    Progress of one upload's ingestion.
+
+    phase moves through:
+        queued → parsing → embedding ⇄ inserting → completed | failed
+    (embedding/inserting alternate once per batch of chunks; the next batch
+    is parsed meanwhile, and the phase only returns to parsing while the
+    job waits for it).
+    """
+    chat_id: int
+    user_id: int
+    storage_paths: list[str]
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    phase: str = "queued"
+    files_total: int = 0
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_cached: int = 0
+    chunks_inserted: int = 0
+    errors: list[str] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+
+    @property
+    def done(self) -> bool:
+        return self.phase in ("completed", "failed")
+
+    def set_phase(self, phase: str) -> None:
+        self.phase = phase
+
+    def finish(self) -> None:
+        self.phase = "completed"
+        self.finished_at = datetime.now()
+
+    def fail(self, error: str) -> None:
+        self.errors.append(error)
+        self.phase = "failed"
+        self.finished_at = datetime.now()
+
+    def to_status(self) -> IngestJobStatus:
+        return IngestJobStatus(
+            job_id=self.job_id,
+            chat_id=self.chat_id,
+            phase=self.phase,
+            files_total=self.files_total,
+            pages_parsed=self.pages_parsed,
+            chunks_total=self.chunks_total,
+            chunks_embedded=self.chunks_embedded,
+            chunks_cached=self.chunks_cached,
+            chunks_inserted=self.chunks_inserted,
+            errors=list(self.errors),
+            created_at=self.created_at.isoformat(),
+            finished_at=self.finished_at.isoformat() if self.finished_at else None,
+        )
+
+    def to_record(self, now: datetime) -> IngestJobRecord:
+        return IngestJobRecord(
+            job_id=self.job_id,
+            chat_id=self.chat_id,
+            user_id=self.user_id,
+            phase=self.phase,
+            files_total=self.files_total,
+            pages_parsed=self.pages_parsed,
+            chunks_total=self.chunks_total,
+            chunks_embedded=self.chunks_embedded,
+            chunks_cached=self.chunks_cached,
+            chunks_inserted=self.chunks_inserted,
+            errors=list(self.errors),
+            created_at=self.created_at,
+            updated_at=now,
+            finished_at=self.finished_at,
+        )
+
+    @classmethod
+    def from_record(cls, record: IngestJobRecord) -> "IngestJob":
+        job = cls(
+            chat_id=record.chat_id,
+            user_id=record.user_id,
+            storage_paths=[],
+            job_id=record.job_id,
+            phase=record.phase,
+            files_total=record.files_total or 0,
+            pages_parsed=record.pages_parsed or 0,
+            chunks_total=record.chunks_total or 0,
+            chunks_embedded=record.chunks_embedded or 0,
+            chunks_cached=record.chunks_cached or 0,
+            chunks_inserted=record.chunks_inserted or 0,
+            errors=list(record.errors or []),
+            created_at=record.created_at,
+            finished_at=record.finished_at,
+        )
+        if not job.done and datetime.now() - record.updated_at > timedelta(seconds=INGEST_JOB_STALE_SECONDS):
+            job.fail(LOST_JOB_ERROR)
+        return job
+
+
+JobRunner = Callable[[IngestJob], Awaitable[None]]
+
+_jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+_queue: Optional[asyncio.Queue] = None
+_workers: list[asyncio.Task] = []
+_accepting = True
+# One thread, so status snapshots are committed in the order they were taken
+_state_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-state")
+
+
+def get_job(job_id: str) -> Optional[IngestJob]:
+    """This process's copy of the job, else its last stored status. Blocking."""
+    job = _jobs.get(job_id)
+    if job is not None:
+        return job
+    db = sessionLocal()
+    try:
+        record = db.get(IngestJobRecord, job_id)
+        return IngestJob.from_record(record) if record else None
+    finally:
+        db.close()
+
+
+def _save(jobs: list[IngestJob]) -> None:
+    db = sessionLocal()
+    try:
+        now = datetime.now()
+        for job in jobs:
+            db.merge(job.to_record(now))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _persist(*jobs: IngestJob) -> None:
+    """Write job statuses to ingest_job; a failed write is logged, never raised."""
+    if not jobs:
+        return
+    try:
+        await asyncio.get_running_loop().run_in_executor(_state_executor, _save, list(jobs))
+    except Exception as e:
+        print(f"Warning: could not store ingest job status: {e}")
+
+
+def fail_orphaned_jobs() -> int:
+    """Mark stored jobs whose worker went away as failed; returns how many. Blocking."""
+    cutoff = datetime.now() - timedelta(seconds=INGEST_JOB_STALE_SECONDS)
+    db = sessionLocal()
+    try:
+        now = datetime.now()
+        result = db.execute(
+            update(IngestJobRecord)
+            .where(IngestJobRecord.phase.not_in(("completed", "failed")), IngestJobRecord.updated_at < cutoff)
+            .values(phase="failed", errors=[LOST_JOB_ERROR], updated_at=now, finished_at=now)
+        )
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+def _remember(job: IngestJob) -> None:
+    _jobs[job.job_id] = job
+    # Forget the oldest finished jobs once we are over the limit
+    if len(_jobs) > INGEST_MAX_JOBS:
+        for old_id in [jid for jid, j in _jobs.items() if j.done]:
+            if len(_jobs) <= INGEST_MAX_JOBS:
+                break
+            del _jobs[old_id]
+
+
+# ── Worker pool ───────────────────────────────────────────────────────────────
+
+async def _worker(queue: asyncio.Queue) -> None:
+    while True:
+        job, runner = await queue.get()
+        try:
+            job.set_phase("parsing")
+            await _persist(job)
+            await runner(job)
+            job.finish()
+            print(f"ingest job {job.job_id} completed for chat {job.chat_id}")
+        except asyncio.CancelledError:
+            job.fail(LOST_JOB_ERROR)
+            raise
+        except Exception as e:
+            print(f"ingest job {job.job_id} failed: {e}")
+            job.fail(str(e))
+        finally:
+            await _persist(job)
+            queue.task_done()
+
+
+async def _heartbeat() -> None:
+    """Keep stored progress fresh, and show other workers these jobs are alive."""
+    while True:
+        await asyncio.sleep(INGEST_HEARTBEAT_SECONDS)
+        await _persist(*[job for job in _jobs.values() if not job.done])
+
+
+def _ensure_workers() -> asyncio.Queue:
+    """Start the worker tasks on the running loop the first time they are needed."""
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+        for _ in range(max(1, INGEST_WORKERS)):
+            _workers.append(asyncio.create_task(_worker(_queue)))
+        _workers.append(asyncio.create_task(_heartbeat()))
+    return _queue
+
+
+async def submit_job(job: IngestJob, runner: JobRunner) -> IngestJob:
+    """Register and store a job, then queue it for the worker pool."""
+    if not _accepting:
+        raise RuntimeError("server is shutting down; please upload again")
+    _remember(job)
+    # Stored before the job id is handed out, so any worker can answer the first poll
+    await _persist(job)
+    _ensure_workers().put_nowait((job, runner))
+    return job
+
+
+async def shutdown() -> None:
+    """
+    Stop taking jobs, cancel the workers and the heartbeat, and store every
+    unfinished job as failed. Called once from main.py's lifespan.
+    """
+    global _accepting
+    _accepting = False
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+    unfinished = [job for job in _jobs.values() if not job.done]
+    for job in unfinished:
+        job.fail(LOST_JOB_ERROR)
+    await _persist(*unfinished)
+    if unfinished:
+        print(f"marked {len(unfinished)} unfinished ingest job(s) failed")
+    _state_executor.shutdown(wait=True)
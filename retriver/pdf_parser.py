@@ -0,0 +1,100 @@
+"""
+Parallel PDF parsing for ingestion.
+
+Text extraction with pypdf is pure-Python and CPU bound, so parsing several
+uploaded files one after another leaves every other core idle. `iter_pages`
+splits each file into page ranges (`PARSE_PAGES_PER_TASK`, default 20) and
+parses the ranges in a process pool (`INGEST_PARSE_PROCESSES`, default: one
+per core), yielding pages as soon as their range finishes. At most two
+ranges per process are in flight, which keeps memory bounded.
+
+INGEST_PARSE_PROCESSES=0 parses in the calling thread instead.
+
+This module is imported by the pool's worker processes; keep its imports light.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Iterator, Optional
+
+from langchain_core.documents import Document
+from pypdf import PdfReader
+
+INGEST_PARSE_PROCESSES = int(os.getenv("INGEST_PARSE_PROCESSES", str(os.cpu_count() or 1)))
+PARSE_PAGES_PER_TASK = int(os.getenv("PARSE_PAGES_PER_TASK", "20"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the parent holds model and DB threads that must not be forked
+        _pool = ProcessPoolExecutor(
+            max_workers=INGEST_PARSE_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def parse_range(path: str, start: int, stop: int) -> list[Document]:
+    """Extract pages [start, stop) of one PDF. Runs in a worker process."""
+    reader = PdfReader(path)
+    total = len(reader.pages)
+    return [
+        Document(
+            page_content=reader.pages[i].extract_text(),
+            metadata={"source": path, "page": i, "total_pages": total},
+        )
+        for i in range(start, min(stop, total))
+    ]
+
+
+def _page_ranges(files: list[Path]) -> Iterator[tuple[str, int, int]]:
+    for pdf in files:
+        total = len(PdfReader(str(pdf)).pages)
+        for start in range(0, total, PARSE_PAGES_PER_TASK):
+            yield str(pdf), start, start + PARSE_PAGES_PER_TASK
+
+
+def iter_pages(filepath: Path) -> Iterator[Document]:
+    """Yield the pages of every PDF in `filepath`, in completion order."""
+    files = sorted(Path(filepath).glob("*.pdf"))
+    ranges = _page_ranges(files)
+
+    if INGEST_PARSE_PROCESSES <= 0:
+        for task in ranges:
+            yield from parse_range(*task)
+        return
+
+    pool = _get_pool()
+    max_in_flight = 2 * INGEST_PARSE_PROCESSES
+    pending: deque = deque()
+    try:
+        for task in ranges:
+            pending.append(pool.submit(parse_range, *task))
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield from future.result()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                yield from future.result()
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,112 @@
+"""
+Optional cross-encoder reranking of retrieved chunks.
+
+With overlapping chunks, the nearest neighbours are often near-duplicates
+of each other and only loosely relevant. When RERANK_ENABLED is set,
+`similarityretriver` over-fetches RERANK_CANDIDATES (default 20) chunks and
+this module scores every (question, chunk) pair with a small cross-encoder
+(RERANK_MODEL, default cross-encoder/ms-marco-MiniLM-L-6-v2), keeping the
+best k.
+
+Inference runs on CPU in batches of RERANK_BATCH_SIZE (default 32) on a
+dedicated thread, off the event loop. Scores are memoized per
+(normalized question, chunk id) in an LRU of RERANK_CACHE_SIZE entries
+(default 4096); chunks are never updated in place, so a cached score stays
+valid. The model is loaded on first use.
+
+Latency is reported as the ("retriever", "rerank") stage in /metrics.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Optional
+
+from utils.metrics import RERANK_CACHE
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+
+ScoreKey = tuple[str, int]
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str, batch_size: int, cache_size: int):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.cache_size = cache_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._scores: "OrderedDict[ScoreKey, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                self._model = CrossEncoder(self.model_name, device="cpu")
+            return self._model
+
+    def _predict(self, pairs: list[tuple[str, str]]) -> list[float]:
+        return self._get_model().predict(pairs, batch_size=self.batch_size).tolist()
+
+    def _cached(self, keys: list[ScoreKey]) -> dict[ScoreKey, float]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                    found[key] = score
+        return found
+
+    def _store(self, scores: dict[ScoreKey, float]) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._scores.update(scores)
+            for key in scores:
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+
+    async def rerank(self, query: str, chunks: list, k: int) -> list:
+        """Return the k RetrievedChunks the cross-encoder scores highest, carrying its scores."""
+        if not chunks:
+            return []
+        normalized = " ".join(query.split())
+        keys = [(normalized, chunk.id) for chunk in chunks]
+        scores = self._cached(keys)
+        RERANK_CACHE.labels("hit").inc(len(scores))
+
+        missing = [(key, chunk) for key, chunk in zip(keys, chunks) if key not in scores]
+        if missing:
+            RERANK_CACHE.labels("miss").inc(len(missing))
+            loop = asyncio.get_running_loop()
+            fresh = await loop.run_in_executor(
+                self._executor, self._predict, [(query, chunk.content) for _, chunk in missing]
+            )
+            computed = {key: score for (key, _), score in zip(missing, fresh)}
+            self._store(computed)
+            scores.update(computed)
+
+        ranked = sorted(zip(keys, chunks), key=lambda pair: scores[pair[0]], reverse=True)
+        return [replace(chunk, score=scores[key]) for key, chunk in ranked[:k]]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+reranker: Optional[CrossEncoderReranker] = (
+    CrossEncoderReranker(RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_CACHE_SIZE) if RERANK_ENABLED else None
+)
@@ -0,0 +1,110 @@
+"""
+Cache of retrieval results.
+
+The agent often calls `search_knowledge_base` with the same or nearly the
+same query, within a turn and across turns, and every call used to embed the
+query and scan pgvector again. `similarityretriver` now keeps the ranked
+chunk ids, scores and distances it found for each (chat_id, normalized
+query, k) in a bounded LRU (RETRIEVAL_CACHE_SIZE, default 1024 entries;
+0 disables), so a repeat only has to load those rows by primary key.
+
+An entry is used only while:
+  - the chat's chunk version is unchanged. `chunk_version` reads it from the
+    database as (chunk count, max chunk id) for the chat, through the chat_id
+    index. Chunks are only appended (ids grow) or deleted, so any write,
+    from this worker or another, changes it, and
+  - it is younger than RETRIEVAL_CACHE_TTL seconds (default 300).
+
+The retriever needs the chat's chunk count anyway, so the version costs no
+extra query on a miss and one small aggregate on a hit.
+
+Lookups are counted in rag_retrieval_cache_total{result} (hit / miss / stale).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.data_models import DocumentChunk
+from utils.metrics import RETRIEVAL_CACHE
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+
+RetrievalKey = tuple[int, str, int]
+Ranking = list[tuple[int, float, Optional[float]]]  # (chunk id, score, distance), best first
+ChunkVersion = tuple[int, Optional[int]]  # (chunk count, max chunk id)
+
+
+async def chunk_version(db: AsyncSession, chat_id: int) -> ChunkVersion:
+    row = (await db.execute(
+        select(func.count(), func.max(DocumentChunk.id)).where(DocumentChunk.chat_id == chat_id)
+    )).one()
+    return row[0], row[1]
+
+
+def retrieval_key(chat_id: int, query: str, k: int) -> RetrievalKey:
+    return (chat_id, " ".join(query.lower().split()), k)
+
+
+class RetrievalCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[RetrievalKey, tuple[ChunkVersion, float, Ranking]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, key: RetrievalKey, version: ChunkVersion) -> Optional[Ranking]:
+        """Cached ranking for `key` if it was computed at the chat's current `version`."""
+        if self.maxsize <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                RETRIEVAL_CACHE.labels("miss").inc()
+                return None
+            stored_version, stored_at, ranking = entry
+            if stored_version != version or time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.stale += 1
+                RETRIEVAL_CACHE.labels("stale").inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            RETRIEVAL_CACHE.labels("hit").inc()
+            return ranking
+
+    def put(self, key: RetrievalKey, version: ChunkVersion, ranking: Ranking) -> None:
+        """Store a ranking computed while the chat was at `version` (read before the search)."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), ranking)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+retrieval_cache = RetrievalCache(RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
@@ -1,16 +1,190 @@
-from retriver.embedding import embeddings
+"""
+Chunk retrieval for a chat.
+
+RETRIEVAL_MODE selects how chunks are ranked:
+  - hybrid (default) : vector nearest neighbours and Postgres full-text matches,
+                       fused with reciprocal rank fusion in a single query
+  - vector           : cosine distance only
+
+Full-text search catches exact terms (formula names, codes, acronyms) that
+embeddings blur. Each side contributes its top HYBRID_CANDIDATES (default 20)
+and a chunk scores sum(1 / (RRF_K + rank)) over the lists it appears in
+(RRF_K default 60).
+
+When reranking is enabled (see retriver/reranker.py) RERANK_CANDIDATES chunks
+are fetched and a cross-encoder picks the best k of them.
+
+The vector side comes from db.indexes.vector_candidates, which also handles
+the compact VECTOR_STORAGE_MODEs (halfvec / binary candidate search, rescored
+in full precision), so distances and ranks are always full-precision.
+
+Results are returned as `RetrievedChunk`s and their ranking is cached per
+(chat, query, k) by retriver/retrieval_cache.py; a cache hit skips the query
+embedding and the search and only loads the chunks by id.
+"""
+
+from retriver.embedding_service import embedding_service
+from retriver.reranker import RERANK_CANDIDATES, reranker
+from retriver.retrieval_cache import Ranking, chunk_version, retrieval_cache, retrieval_key
 from db.data_models import DocumentChunk
-from db.config import init_db
-from sqlalchemy import select
+from db.config import init_async_db
+from db.indexes import (
+    EXACT_SEARCH_MAX_CHUNKS,
+    FTS_CONFIG,
+    FTS_EXPRESSION,
+    apply_search_settings,
+    reset_search_settings,
+    vector_candidates,
+)
+from sqlalchemy import select, func, literal_column
 from typing import Annotated
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
-async def similarityretriver(question:str,chat_id:int,k:int,db:Annotated[Session,Depends(init_db)]):
-    query_vector = embeddings.embed_query(question)
-    results = db.scalars(
-        select(DocumentChunk)
-        .where(DocumentChunk.chat_id == chat_id)
-        .order_by(DocumentChunk.embedding.cosine_distance(query_vector))
+from utils.metrics import stage
+from dataclasses import dataclass
+from typing import Optional
+import os
+
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+if RETRIEVAL_MODE not in ("hybrid", "vector"):
+    raise ValueError(f"Invalid RETRIEVAL_MODE: {RETRIEVAL_MODE!r}")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+@dataclass
+class RetrievedChunk:
+    """A retrieved document chunk, detached from any session."""
+    id: int
+    content: str
+    doc_metadata: Optional[dict]
+    # Ranking value: cosine distance (vector), fused RRF score (hybrid) or
+    # cross-encoder score (reranked)
+    score: float
+    # Full-precision cosine distance to the query; None for a chunk that only
+    # the full-text side of hybrid retrieval found
+    distance: Optional[float] = None
+
+
+def _vector_query(chat_id: int, query_vector, k: int, exact: bool):
+    nearest = vector_candidates(chat_id, query_vector, k, exact)
+    return (
+        select(
+            DocumentChunk.id, DocumentChunk.content, DocumentChunk.doc_metadata,
+            nearest.c.distance.label("score"), nearest.c.distance,
+        )
+        .join(nearest, DocumentChunk.id == nearest.c.id)
+        .order_by(nearest.c.distance)
+    )
+
+
+def _hybrid_query(chat_id: int, question: str, query_vector, k: int, candidates: int, exact: bool):
+    nearest = vector_candidates(chat_id, query_vector, candidates, exact)
+    vec = (
+        select(nearest.c.id, nearest.c.distance, func.row_number().over(order_by=nearest.c.distance).label("rank"))
+        .cte("vec")
+    )
+
+    # Same expression as the GIN index, so the match is an index lookup
+    tsv = literal_column(FTS_EXPRESSION)
+    tsq = func.websearch_to_tsquery(literal_column(f"'{FTS_CONFIG}'::regconfig"), question)
+    lexical_rank = func.ts_rank_cd(tsv, tsq)
+    lex = (
+        select(DocumentChunk.id, func.row_number().over(order_by=lexical_rank.desc()).label("rank"))
+        .where(DocumentChunk.chat_id == chat_id, tsv.op("@@")(tsq))
+        .order_by(lexical_rank.desc())
+        .limit(candidates)
+        .cte("lex")
+    )
+
+    score = (
+        func.coalesce(1.0 / (RRF_K + vec.c.rank), 0.0)
+        + func.coalesce(1.0 / (RRF_K + lex.c.rank), 0.0)
+    )
+    fused = (
+        select(func.coalesce(vec.c.id, lex.c.id).label("id"), score.label("score"), vec.c.distance)
+        .select_from(vec.outerjoin(lex, vec.c.id == lex.c.id, full=True))
+        .subquery("fused")
+    )
+    return (
+        select(DocumentChunk.id, DocumentChunk.content, DocumentChunk.doc_metadata, fused.c.score, fused.c.distance)
+        .join(fused, DocumentChunk.id == fused.c.id)
+        .order_by(fused.c.score.desc(), DocumentChunk.id)
         .limit(k)
-    ).all()
-    return results
\ No newline at end of file
+    )
+
+
+async def _nearest_chunks(db: AsyncSession, chat_id: int, question: str, query_vector, k: int, exact: bool) -> list[RetrievedChunk]:
+    if RETRIEVAL_MODE == "hybrid":
+        candidates = max(HYBRID_CANDIDATES, k)
+        statement = _hybrid_query(chat_id, question, query_vector, k, candidates, exact)
+    else:
+        candidates = k
+        statement = _vector_query(chat_id, query_vector, k, exact)
+
+    await apply_search_settings(db, exact, candidates)
+    try:
+        rows = (await db.execute(statement)).all()
+    finally:
+        await reset_search_settings(db, exact)
+    return [
+        RetrievedChunk(
+            row.id, row.content, row.doc_metadata, float(row.score),
+            None if row.distance is None else float(row.distance),
+        )
+        for row in rows
+    ]
+
+
+async def _load_ranking(db: AsyncSession, ranking: Ranking) -> Optional[list[RetrievedChunk]]:
+    """Load cached chunk ids in ranked order; None if any of them is gone."""
+    ids = [chunk_id for chunk_id, _, _ in ranking]
+    rows = (await db.execute(
+        select(DocumentChunk.id, DocumentChunk.content, DocumentChunk.doc_metadata)
+        .where(DocumentChunk.id.in_(ids))
+    )).all()
+    by_id = {row.id: row for row in rows}
+    if len(by_id) < len(ids):
+        return None
+    return [
+        RetrievedChunk(chunk_id, by_id[chunk_id].content, by_id[chunk_id].doc_metadata, score, distance)
+        for chunk_id, score, distance in ranking
+    ]
+
+
+async def similarityretriver(question:str,chat_id:int,k:int,db:Annotated[AsyncSession,Depends(init_async_db)]) -> list[RetrievedChunk]:
+    key = retrieval_key(chat_id, question, k)
+    # Read before searching: chunks committed meanwhile make this entry stale
+    with stage("retriever", "count"):
+        version = await chunk_version(db, chat_id)
+    ranking = retrieval_cache.get(key, version)
+    if ranking is not None:
+        with stage("retriever", "hydrate"):
+            cached = await _load_ranking(db, ranking)
+        if cached is not None:
+            return cached
+
+    with stage("retriever", "embed"):
+        query_vector = await embedding_service.embed_query(question)
+
+    # Small chats are cheaper (and fully accurate) to scan exactly; the ANN
+    # index only pays off once a chat has many chunks.
+    chunk_count = version[0]
+    exact = chunk_count <= EXACT_SEARCH_MAX_CHUNKS
+    # Over-fetch when a reranker will choose the final k
+    fetch = max(RERANK_CANDIDATES, k) if reranker else k
+    with stage("retriever", "search"):
+        results = await _nearest_chunks(db, chat_id, question, query_vector, fetch, exact)
+
+    # The ANN index filters on chat_id after the graph search and can come back
+    # short for a chat that is a small slice of the table; redo it exactly.
+    if not exact and len(results) < min(fetch, chunk_count):
+        with stage("retriever", "exact_fallback"):
+            results = await _nearest_chunks(db, chat_id, question, query_vector, fetch, exact=True)
+
+    if reranker and len(results) > k:
+        with stage("retriever", "rerank"):
+            results = await reranker.rerank(question, results, k)
+
+    retrieval_cache.put(key, version, [(chunk.id, chunk.score, chunk.distance) for chunk in results])
+    return results
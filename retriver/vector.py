@@ -1,31 +1,131 @@
+import asyncio
+import os
 from pathlib import Path
 from sqlalchemy.orm import Session
 from pgvector.sqlalchemy import Vector
 from sqlalchemy import select
-from langchain_community.document_loaders import PyPDFDirectoryLoader
-from typing import Annotated
-from db.data_models import DocumentChunk
+from typing import Annotated, Iterator, Optional
+from db.bulk import bulk_insert_chunks
 from db.config import init_db
-from retriver.embedding import embeddings
+from retriver.chunk_cache import embed_chunks
+from retriver.ingest import IngestJob
+from retriver.pdf_parser import iter_pages
 from retriver.text_spilter import text_splitter
 from fastapi import Depends
-async def add_vector_to_db(chat_id: int, filepath: Path,db:Annotated[Session,Depends(init_db)]):
+from utils.metrics import stage
+
+# Chunks are embedded and committed in batches of this size, so a chat becomes
+# searchable as soon as its first batch lands instead of after the whole upload.
+# It also bounds memory: only the page ranges in flight in the parser pool, the
+# next batch being parsed and one batch of chunks and vectors are held at a
+# time, whatever the upload size.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+
+
+def _iter_chunk_batches(filepath: Path, job: IngestJob) -> Iterator[list]:
+    """Split pages as the parser pool hands them over and yield chunks in batches."""
+    batch = []
+    pages = iter_pages(filepath)
+    try:
+        for page in pages:
+            job.pages_parsed += 1
+            chunks = text_splitter.split_documents([page])
+            job.chunks_total += len(chunks)
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+    finally:
+        # Cancels parser tasks still in flight if we stopped early
+        pages.close()
+
+
+class _BatchPuller:
+    """
+    Pulls batches from `_iter_chunk_batches` in a thread, one ahead of the
+    consumer. The generator is only ever closed after the `next` running in
+    its thread has returned, even when the consuming task is cancelled.
+    """
+
+    def __init__(self, batches: Iterator[list]):
+        self._batches = batches
+        self._pull: Optional[asyncio.Future] = None
+
+    def start(self) -> None:
+        self._pull = asyncio.ensure_future(asyncio.to_thread(next, self._batches, None))
+
+    @property
+    def ready(self) -> bool:
+        return self._pull is not None and self._pull.done()
+
+    async def take(self) -> Optional[list]:
+        # Shielded: cancelling the job must not abandon a `next` mid-generator
+        return await asyncio.shield(self._pull)
+
+    async def close(self) -> None:
+        if self._pull is not None:
+            await asyncio.wait([self._pull])
+            if not self._pull.cancelled():
+                self._pull.exception()  # already reported by take(), or irrelevant now
+        await asyncio.to_thread(self._batches.close)
+
+
+def _insert_batch(db: Session, chat_id: int, docs, vectors) -> None:
+    bulk_insert_chunks(db, [
+        {
+            "chat_id": chat_id,
+            "content": doc.page_content,
+            "doc_metadata": doc.metadata,
+            "embedding": vector,
+        }
+        for doc, vector in zip(docs, vectors)
+    ])
+    db.commit()
+
+
+async def add_vector_to_db(chat_id: int, filepath: Path,db:Annotated[Session,Depends(init_db)], job: Optional[IngestJob] = None):
+    """
+    Parse every PDF in `filepath`, embed the chunks and store them for `chat_id`.
+
+    Works as a streaming pipeline: page → split → embed batch → insert batch,
+    committing after every batch so partial progress survives a failure.
+    Blocking work runs in threads. When `job` is given its phase and counters
+    are updated as the upload progresses.
+    """
+    job = job or IngestJob(chat_id=chat_id, user_id=0, storage_paths=[])
+    batches = _BatchPuller(_iter_chunk_batches(filepath, job))
     try:
         print("vector upload started ")
-        loader = PyPDFDirectoryLoader(filepath)
-        docs = loader.load()
-        split_docs = text_splitter.split_documents(docs)
-
-        texts = [d.page_content for d in split_docs]
-        vectors = embeddings.embed_documents(texts)
-        for doc, vector in zip(split_docs, vectors):
-            db.add(DocumentChunk(
-                chat_id=chat_id,
-                content=doc.page_content,
-                doc_metadata=doc.metadata,
-                embedding=vector,
-            ))
-        db.commit()
+        with stage("ingest", "total"):
+            # Parsing is blocking; batches are pulled from a thread, the next one
+            # while the current one is embedded and inserted
+            batches.start()
+            while True:
+                if not batches.ready:
+                    job.set_phase("parsing")
+                with stage("ingest", "parse"):
+                    batch = await batches.take()
+                if batch is None:
+                    break
+                batches.start()
+
+                job.set_phase("embedding")
+                texts = [d.page_content for d in batch]
+                with stage("ingest", "embed"):
+                    vectors, cached = await embed_chunks(texts, db)
+                job.chunks_embedded += len(batch)
+                job.chunks_cached += cached
+
+                job.set_phase("inserting")
+                with stage("ingest", "insert"):
+                    await asyncio.to_thread(_insert_batch, db, chat_id, batch, vectors)
+                job.chunks_inserted += len(batch)
         print("vector upload complete")
     finally:
-        db.close()  
\ No newline at end of file
+        try:
+            await batches.close()
+        finally:
+            db.close()
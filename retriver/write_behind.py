@@ -0,0 +1,124 @@
+"""
+Write-behind queue for chat-turn DocumentChunks.
+
+Each /chat turn stores two retrievable chunks: the user's question and the
+Q&A pair. Embedding and inserting them used to happen inside the request,
+adding two forward passes and several commits to every response. Handlers
+now `enqueue` them and return; a background worker drains the queue,
+embeds everything it picked up in one document batch on the embedding
+service and writes the rows with one bulk insert and one commit.
+
+Texts already in the query-embedding cache (typically the question, embedded
+for retrieval during the turn) are reused; the rest go through
+`embed_documents`, not `embed_query`, so long one-off Q&A texts never take
+up room in the query LRU.
+
+Failed batches are retried with exponential backoff (WRITE_BEHIND_RETRIES,
+default 3; WRITE_BEHIND_BACKOFF seconds, default 0.5). `flush()` waits for
+everything queued so far and is called on shutdown so nothing is lost.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from db.bulk import bulk_insert_chunks
+from db.database import sessionLocal
+from retriver.embedding_cache import cache_key, query_embedding_cache
+from retriver.embedding_service import embedding_service
+
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "32"))
+WRITE_BEHIND_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", "3"))
+WRITE_BEHIND_BACKOFF = float(os.getenv("WRITE_BEHIND_BACKOFF", "0.5"))
+
+
+@dataclass
+class PendingChunk:
+    chat_id: int
+    content: str
+    doc_metadata: dict
+    embed_text: str  # text whose embedding is stored (may differ from content)
+
+
+class WriteBehindQueue:
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def enqueue(self, chunk: PendingChunk) -> None:
+        """Queue a chunk for embedding + insert. Must be called from the event loop."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            # Fresh context: the worker must not inherit the request-scoped
+            # embedding cache of whichever request happened to start it.
+            self._worker = asyncio.create_task(self._run(), context=contextvars.Context())
+        self._queue.put_nowait(chunk)
+
+    async def flush(self) -> None:
+        """Wait until every chunk queued so far has been written (or given up on)."""
+        if self._queue is not None and self._worker is not None and not self._worker.done():
+            await self._queue.join()
+
+    async def shutdown(self) -> None:
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < WRITE_BEHIND_BATCH and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _write(self, batch: list[PendingChunk]) -> None:
+        for attempt in range(WRITE_BEHIND_RETRIES + 1):
+            try:
+                vectors = await _embed([c.embed_text for c in batch])
+                rows = [
+                    {
+                        "chat_id": c.chat_id,
+                        "content": c.content,
+                        "doc_metadata": c.doc_metadata,
+                        "embedding": vector,
+                    }
+                    for c, vector in zip(batch, vectors)
+                ]
+                await asyncio.to_thread(_insert, rows)
+                return
+            except Exception as e:
+                if attempt == WRITE_BEHIND_RETRIES:
+                    print(f"write-behind: dropping {len(batch)} chunk(s) after {attempt + 1} attempts: {e}")
+                    return
+                print(f"write-behind: write failed ({e}), retrying")
+                await asyncio.sleep(WRITE_BEHIND_BACKOFF * 2 ** attempt)
+
+
+async def _embed(texts: list[str]) -> list[list[float]]:
+    vectors = [query_embedding_cache.peek(cache_key(text)) for text in texts]
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+    computed = dict(zip(missing, await embedding_service.embed_documents(missing)))
+    return [vector if vector is not None else computed[text] for text, vector in zip(texts, vectors)]
+
+
+def _insert(rows: list[dict]) -> None:
+    db = sessionLocal()
+    try:
+        bulk_insert_chunks(db, rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+write_behind = WriteBehindQueue()
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException,Depends
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Annotated
-from db.config import init_db
+from db.config import init_async_db
 from db.data_models import Users
 from utils.jwt import generate_token
 from models.pymodel import token_payload
@@ -39,7 +40,7 @@ def githublogin():
     return RedirectResponse(github_auth_url, status_code=302)
 
 @router.get("/github/callback")
-async def github_callback(code: str,db: Annotated[Session, Depends(init_db)]):
+async def github_callback(code: str,db: Annotated[AsyncSession, Depends(init_async_db)]):
     """
     GitHub OAuth callback endpoint.
     Receives the authorization code and exchanges it for an access token.
@@ -128,10 +129,10 @@ async def github_callback(code: str,db: Annotated[Session, Depends(init_db)]):
                 detail="Unable to retrieve email from GitHub account"
             )
         
-        existing_user = db.query(Users).filter(Users.email == useremail).first()
+        existing_user = await db.scalar(select(Users).where(Users.email == useremail))
         if existing_user:
             # Generate JWT token for existing user
-            token_data = token_payload(userid=existing_user.user_id)
+            token_data = token_payload(userid=existing_user.user_id, user_name=existing_user.user_name, email=existing_user.email)
             jwt_token = generate_token(token_data)
             
             if not jwt_token:
@@ -149,11 +150,11 @@ async def github_callback(code: str,db: Annotated[Session, Depends(init_db)]):
             email=useremail,
         )
         db.add(newuser)
-        db.commit()
-        db.refresh(newuser)
+        await db.commit()
+        await db.refresh(newuser)
         
         # Generate JWT token for new user
-        token_data = token_payload(userid=newuser.user_id)
+        token_data = token_payload(userid=newuser.user_id, user_name=newuser.user_name, email=newuser.email)
         jwt_token = generate_token(token_data)
         
         if not jwt_token:
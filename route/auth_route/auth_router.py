@@ -77,7 +77,7 @@ def loginuser(userdata: login_user_request, db: Annotated[Session, Depends(init_
             )
         
         # Generate token
-        payload = token_payload(userid=exist_user.user_id)
+        payload = token_payload(userid=exist_user.user_id, user_name=exist_user.user_name, email=exist_user.email)
         usertoken = generate_token(payload)
         if not usertoken:
             raise HTTPException(
@@ -1,108 +1,246 @@
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from models.pymodel import ChatRequest, ChatResponse, LLMResponseFormat
-from llm.chatmodel import get_response
-from typing import Annotated
+from llm.chatmodel import get_response, stream_response
+from typing import Annotated, Optional
 from models.pymodel import userdataforapi
 from utils.protectroute import get_current_user
+from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
-from db.config import init_db
-from db.data_models import Chat, Message, DocumentChunk
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.config import init_db, init_async_db
+from db.database import asyncSessionLocal
+from db.data_models import Chat, Message, DocumentChunk, IngestJobRecord
 from models.pymodel import chat, message, RenameChatRequest
-from retriver.embedding import embeddings
+from retriver.answer_cache import ANSWER_CACHE_ENABLED, AnswerFreshness, answer_metadata, lookup_answer
+from retriver.embedding_cache import request_embedding_scope
+from retriver.write_behind import PendingChunk, write_behind
 from datetime import datetime
 import os
 import shutil
 import json
-from pathlib import Path
-import sys
 from fastapi.responses import RedirectResponse
 
-sys.path.append(str(Path(__file__).resolve().parent.parent.parent / "supabase"))
-from supabase_client import supabase
+from utils.storage import get_storage, StorageError
+from utils.metrics import stage
 router = APIRouter()
 
-@router.post("/chat", response_model=ChatResponse)
-async def pdfchat(req: ChatRequest,user:Annotated[userdataforapi,Depends(get_current_user)],db:Annotated[Session,Depends(init_db)]):
+async def _store_turn(db: AsyncSession, req: ChatRequest, llm_response: LLMResponseFormat, sources: list,
+                      freshness: Optional[AnswerFreshness], from_cache: bool):
+    """
+    Persist a finished chat turn.
+
+    Both Messages are written in one transaction. A turn that fails before
+    this point stores only the user's Message (`_store_question`). The retrievable chunks for
+    the user question and the Q&A pair need embeddings, so they go to the
+    write-behind queue and are stored after the response has been sent.
+    Answers served from the answer cache (`from_cache`) already have their
+    question and Q&A chunks. `freshness` is None when the answer cache is off.
+    """
+    usermessage = Message(
+        chat_id=req.chat_id,
+        role="user",
+        content=req.question,
+    )
+    # Store structured AI response back into the shared Message table
+    assistant_msg = Message(
+        chat_id=req.chat_id,
+        role="assistant",
+        content=llm_response.answer,
+        key_points=llm_response.key_points or [],
+        sources_cited=llm_response.sources_cited or [],
+        follow_up_suggestions=llm_response.follow_up_suggestions or [],
+        confidence_level=llm_response.confidence_level,
+        sources=[source.model_dump() for source in sources],
+    )
+    db.add_all([usermessage, assistant_msg])
+    await db.commit()
+    if from_cache:
+        return
+
+    # The question chunk points the answer cache at the assistant Message;
+    # answers that asked for clarification are not reused
+    question_metadata = {"source": "user"}
+    if freshness is not None and not llm_response.needs_clarification:
+        question_metadata.update(answer_metadata(assistant_msg.message_id, freshness))
+
+    # Store user question as a DocumentChunk for future context retrieval
+    write_behind.enqueue(PendingChunk(
+        chat_id=req.chat_id,
+        content=f"User question: {req.question}",
+        doc_metadata=question_metadata,
+        embed_text=req.question,
+    ))
+
+    # Store Q&A pair as a DocumentChunk so future questions can retrieve past answers
+    qa_text = (
+        f"Q: {req.question}\n"
+        f"A: {llm_response.answer}\n"
+        f"Key Points: {', '.join(llm_response.key_points or [])}"
+    )
+    write_behind.enqueue(PendingChunk(
+        chat_id=req.chat_id,
+        content=qa_text,
+        doc_metadata={"source": "AI", "question": req.question},
+        embed_text=qa_text,
+    ))
+
+
+async def _store_question(db: AsyncSession, req: ChatRequest):
+    """Keep the user's question in the conversation when no answer was produced."""
     try:
-        cur_chat = db.query(Chat).filter(Chat.chat_id==req.chat_id, Chat.user_id==user.user_id).first()
-        if not cur_chat:
-            raise Exception("Chat not found or access denied")
-        usermessage = Message(
-            chat_id=req.chat_id,
-            role="user",
-            content=req.question,
-        )
-        db.add(usermessage)
-        db.commit()
+        db.add(Message(chat_id=req.chat_id, role="user", content=req.question))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        print(f"Warning: could not store the question: {e}")
 
-        # Store user question as a DocumentChunk for future context retrieval
-        user_vector = embeddings.embed_query(req.question)
-        db.add(DocumentChunk(
-            chat_id=req.chat_id,
-            content=f"User question: {req.question}",
-            doc_metadata={"source": "user"},
-            embedding=user_vector,
-        ))
-        db.commit()
+
+async def _owned_chat(db: AsyncSession, chat_id: int, user_id: int):
+    return await db.scalar(select(Chat).where(Chat.chat_id==chat_id, Chat.user_id==user_id))
+
+
+async def _cached_answer(db: AsyncSession, req: ChatRequest):
+    """(CachedAnswer or None, AnswerFreshness); (None, None) when the answer cache is off."""
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    with stage("chat", "answer_cache"):
+        return await lookup_answer(db, req)
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def pdfchat(req: ChatRequest,user:Annotated[userdataforapi,Depends(get_current_user)],db:Annotated[AsyncSession,Depends(init_async_db)]):
+    # Query embeddings computed during this turn are shared by the agent tools and citations
+    with request_embedding_scope(), stage("chat", "total"):
+        owned = stored = False
+        try:
+            with stage("chat", "ownership_check"):
+                cur_chat = await _owned_chat(db, req.chat_id, user.user_id)
+                if not cur_chat:
+                    raise Exception("Chat not found or access denied")
+            owned = True
+            # A near-identical earlier question with unchanged documents and conversation
+            # is answered from storage
+            cached, freshness = await _cached_answer(db, req)
+            # End the read transaction so no connection is held while the agent runs
+            await db.commit()
         
-        # Get structured response + source citations from LLM
-        llm_response: LLMResponseFormat
-        sources: list
-        llm_response, sources = await get_response(req, req.chat_id, db)
-        if not llm_response:
-            raise Exception("Failed to generate response")
+            # Get structured response + source citations from LLM
+            llm_response: LLMResponseFormat
+            sources: list
+            if cached:
+                llm_response, sources = cached.response, cached.sources
+            else:
+                with stage("chat", "agent"):
+                    llm_response, sources = await get_response(req, req.chat_id)
+                if not llm_response:
+                    raise Exception("Failed to generate response")
         
-        # Store structured AI response back into the shared Message table
-        assistant_msg = Message(
-            chat_id=req.chat_id,
-            role="assistant",
-            content=llm_response.answer,
-            key_points=llm_response.key_points or [],
-            sources_cited=llm_response.sources_cited or [],
-            follow_up_suggestions=llm_response.follow_up_suggestions or [],
-        )
-        db.add(assistant_msg)
-        db.commit()
-
-        # Store Q&A pair as a DocumentChunk so future questions can retrieve past answers
-        qa_text = (
-            f"Q: {req.question}\n"
-            f"A: {llm_response.answer}\n"
-            f"Key Points: {', '.join(llm_response.key_points or [])}"
-        )
-        qa_vector = embeddings.embed_query(qa_text)
-        db.add(DocumentChunk(
-            chat_id=req.chat_id,
-            content=qa_text,
-            doc_metadata={"source": "AI", "question": req.question},
-            embedding=qa_vector,
-        ))
-        db.commit()
+            with stage("chat", "store_turn"):
+                await _store_turn(db, req, llm_response, sources, freshness, from_cache=cached is not None)
+            stored = True
         
-        # Return comprehensive response with all structured data
-        return ChatResponse(
-            success=True,
-            chat_id=req.chat_id,
-            response=json.dumps(llm_response.dict(), ensure_ascii=False, indent=2),  # Full structured response as JSON
-            role="assistant",
-            timestamp=datetime.now().isoformat(),
-            sources_used=len(llm_response.sources_cited) if llm_response.sources_cited else 0,
-            sources=sources,
-            error_message=None
-        )
-    except Exception as e:
-        db.rollback()
-        print(f"Chat error: {e}")
-        return ChatResponse(
-            success=False,
-            chat_id=req.chat_id,
-            response="",
-            role="assistant",
-            timestamp=datetime.now().isoformat(),
-            sources_used=None,
-            error_message=str(e)
-        )
+            # Return comprehensive response with all structured data
+            return ChatResponse(
+                success=True,
+                chat_id=req.chat_id,
+                response=json.dumps(llm_response.dict(), ensure_ascii=False, indent=2),  # Full structured response as JSON
+                role="assistant",
+                timestamp=datetime.now().isoformat(),
+                sources_used=len(llm_response.sources_cited) if llm_response.sources_cited else 0,
+                sources=sources,
+                error_message=None
+            )
+        except Exception as e:
+            await db.rollback()
+            print(f"Chat error: {e}")
+            if owned and not stored:
+                await _store_question(db, req)
+            return ChatResponse(
+                success=False,
+                chat_id=req.chat_id,
+                response="",
+                role="assistant",
+                timestamp=datetime.now().isoformat(),
+                sources_used=None,
+                error_message=str(e)
+            )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/chat/stream")
+async def pdfchat_stream(req: ChatRequest,user:Annotated[userdataforapi,Depends(get_current_user)],db:Annotated[AsyncSession,Depends(init_async_db)]):
+    """
+    Server-sent-events version of /chat.
+
+    Events, in order:
+      tool   {"status": "called", "tool": name} / {"status": "completed"}
+      token  {"delta": "..."}                 answer text as the model writes it
+                                              (one event with the whole answer if cached)
+      final  {"response": LLMResponseFormat, "sources": [SourceCitation], ...}
+      error  {"error_message": "..."}         instead of final, if the run fails
+    """
+    cur_chat = await _owned_chat(db, req.chat_id, user.user_id)
+    if not cur_chat:
+        raise HTTPException(status_code=404, detail="Chat not found or access denied")
+
+    async def answer(stream_db: AsyncSession):
+        cached, freshness = await _cached_answer(stream_db, req)
+        await stream_db.commit()
+        if cached:
+            yield "token", {"delta": cached.response.answer}
+            yield "final", {"response": cached.response, "sources": cached.sources,
+                            "freshness": freshness, "from_cache": True}
+            return
+        async for event, data in stream_response(req, req.chat_id):
+            if event == "final":
+                data.update(freshness=freshness, from_cache=False)
+            yield event, data
+
+    async def events():
+        # The request-scoped session is released before streaming starts,
+        # so the stream uses its own.
+        stream_db = asyncSessionLocal()
+        stored = False
+        with request_embedding_scope():
+            try:
+                async for event, data in answer(stream_db):
+                    if event != "final":
+                        yield _sse(event, data)
+                        continue
+
+                    llm_response: LLMResponseFormat = data["response"]
+                    if not llm_response:
+                        raise Exception("Failed to generate response")
+                    await _store_turn(stream_db, req, llm_response, data["sources"], data["freshness"], data["from_cache"])
+                    stored = True
+                    yield _sse("final", {
+                        "success": True,
+                        "chat_id": req.chat_id,
+                        "response": llm_response.model_dump(),
+                        "sources": [s.model_dump() for s in data["sources"]],
+                        "sources_used": len(llm_response.sources_cited) if llm_response.sources_cited else 0,
+                        "timestamp": datetime.now().isoformat(),
+                    })
+            except Exception as e:
+                await stream_db.rollback()
+                print(f"Chat stream error: {e}")
+                if not stored:
+                    await _store_question(stream_db, req)
+                yield _sse("error", {"success": False, "chat_id": req.chat_id, "error_message": str(e)})
+            finally:
+                await stream_db.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/getchat")
 def getchat(user:Annotated[userdataforapi,Depends(get_current_user)],db:Annotated[Session,Depends(init_db)]):
      try:
@@ -150,22 +288,24 @@ def getchatconversation(chatid:int,user:Annotated[userdataforapi,Depends(get_cur
         }
 
 @router.delete("/deletechat")
-def deletechat(chatid:int,user:Annotated[userdataforapi,Depends(get_current_user)],db:Annotated[Session,Depends(init_db)]):
+async def deletechat(chatid:int,user:Annotated[userdataforapi,Depends(get_current_user)],db:Annotated[AsyncSession,Depends(init_async_db)]):
     try:
         # Verify chat belongs to user before deletion
-        chat_to_delete = db.query(Chat).filter(Chat.chat_id==chatid, Chat.user_id==user.user_id).first()
+        chat_to_delete = await _owned_chat(db, chatid, user.user_id)
         if not chat_to_delete:
             raise HTTPException(status_code=404, detail="Chat not found or access denied")
         
         # Delete all document chunks linked to this chat
-        db.query(DocumentChunk).filter(DocumentChunk.chat_id==chatid).delete(synchronize_session=False)
+        await db.execute(delete(DocumentChunk).where(DocumentChunk.chat_id==chatid))
         
         # Delete all messages in the chat
-        db.query(Message).filter(Message.chat_id==chatid).delete(synchronize_session=False)
+        await db.execute(delete(Message).where(Message.chat_id==chatid))
+        await db.execute(delete(IngestJobRecord).where(IngestJobRecord.chat_id==chatid))
         
         # Delete files from Supabase
         try:
-            files = supabase.storage.from_("chat-documents").list(path=str(chatid))
+            storage = get_storage()
+            files = await storage.list(str(chatid))
             if files:
                 file_paths = []
                 for f in files:
@@ -174,23 +314,23 @@ def deletechat(chatid:int,user:Annotated[userdataforapi,Depends(get_current_user
                         file_paths.append(f"{chatid}/{name}")
                 
                 if file_paths:
-                    supabase.storage.from_("chat-documents").remove(file_paths)
+                    await storage.remove(file_paths)
         except Exception as e:
             print(f"Warning: Failed to delete files from Supabase: {e}")
         
         # Delete the chat record
-        db.delete(chat_to_delete)
-        db.commit()
+        await db.delete(chat_to_delete)
+        await db.commit()
         print("delete chat successful")
         return {
             "Successful":True,
             "message":"Chat deleted successfully"
         }
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Failed to delete chat: {e}")
         return {
             "Successful":False,
@@ -231,22 +371,19 @@ def renamechat(
 
 
 @router.get("/pdf")
-def get_chat_pdfs(
+async def get_chat_pdfs(
     chatid: int,
     user: Annotated[userdataforapi, Depends(get_current_user)],
-    db: Annotated[Session, Depends(init_db)],
+    db: Annotated[AsyncSession, Depends(init_async_db)],
 ):
     """Return metadata for all PDF files belonging to a chat."""
     try:
-        cur_chat = db.query(Chat).filter(
-            Chat.chat_id == chatid,
-            Chat.user_id == user.user_id,
-        ).first()
+        cur_chat = await _owned_chat(db, chatid, user.user_id)
         if not cur_chat:
             raise HTTPException(status_code=404, detail="Chat not found or access denied")
 
         try:
-            files = supabase.storage.from_("chat-documents").list(path=str(chatid))
+            files = await get_storage().list(str(chatid))
         except Exception as e:
             print(f"Supabase list error: {e}")
             return {"Successful": True, "files": []}
@@ -276,18 +413,15 @@ def get_chat_pdfs(
         return {"Successful": False, "files": [], "error": str(e)}
 
 @router.get("/pdf/download")
-def download_pdf(
+async def download_pdf(
     chatid: int,
     filename: str,
     user: Annotated[userdataforapi, Depends(get_current_user)],
-    db: Annotated[Session, Depends(init_db)],
+    db: Annotated[AsyncSession, Depends(init_async_db)],
 ):
     """Generate a signed URL and redirect the client to download the PDF."""
     try:
-        cur_chat = db.query(Chat).filter(
-            Chat.chat_id == chatid,
-            Chat.user_id == user.user_id,
-        ).first()
+        cur_chat = await _owned_chat(db, chatid, user.user_id)
         if not cur_chat:
             raise HTTPException(status_code=404, detail="Chat not found or access denied")
 
@@ -298,13 +432,10 @@ def download_pdf(
 
         file_path = f"{chatid}/{safe_name}"
 
-        url_response = supabase.storage.from_("chat-documents").create_signed_url(
-            path=file_path, 
-            expires_in=3600
-        )
-        
-        signed_url = url_response.get('signedURL')
-        if not signed_url:
+        try:
+            signed_url = await get_storage().create_signed_url(file_path, expires_in=3600)
+        except StorageError as e:
+            print(f"Signed URL error: {e}")
             raise HTTPException(status_code=404, detail="File not found or URL generation failed")
 
         return RedirectResponse(url=signed_url)
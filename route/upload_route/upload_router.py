@@ -1,20 +1,25 @@
 from fastapi import APIRouter,UploadFile, File, HTTPException,Depends
 from typing import List,Annotated
+import asyncio
 import shutil
+import tempfile
+from functools import partial
 from pathlib import Path
 from datetime import datetime
 from retriver.vector import add_vector_to_db
+from retriver.ingest import IngestJob, get_job, submit_job
 from utils.protectroute import get_current_user
-from utils.upload import upload_chat_file, download_for_processing
-from sqlalchemy.orm import Session
-from models.pymodel import userdataforapi
-from db.config import init_db
+from utils.upload import new_storage_path, spool_upload, start_chat_uploads
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.pymodel import userdataforapi, IngestJobStatus
+from db.config import init_async_db
+from db.database import sessionLocal
 from db.data_models import Chat
 
 router = APIRouter()
 
 @router.post("/upload-pdfs")
-async def upload_pdfs(db:Annotated[Session,Depends(init_db)],user:Annotated[userdataforapi,Depends(get_current_user)],files: List[UploadFile] = File(...)):
+async def upload_pdfs(db:Annotated[AsyncSession,Depends(init_async_db)],user:Annotated[userdataforapi,Depends(get_current_user)],files: List[UploadFile] = File(...)):
     uploaded_files = []
     errors = []
     
@@ -37,64 +42,97 @@ async def upload_pdfs(db:Annotated[Session,Depends(init_db)],user:Annotated[user
             user_id=user.user_id
         )
         db.add(newchat)
-        db.commit()
-        db.refresh(newchat)
+        await db.commit()
+        await db.refresh(newchat)
         chat_id = newchat.chat_id
         chat_name = newchat.chat_name
     except Exception as e:
         return {"message": f"Failed to create chat: {str(e)}", "errors": errors}
 
-    storage_paths = []
-    
+    # Keep a local copy of every file: ingestion parses these directly while
+    # the durable copy is uploaded to Supabase in the background.
+    tmp_dir = Path(tempfile.mkdtemp())
+    uploads = []
+
     for file in valid_files:
         try:
-            storage_path = upload_chat_file(chat_id, file)
-            storage_paths.append(storage_path)
-            
+            storage_path = new_storage_path(chat_id, file.filename)
+            local_path = await asyncio.to_thread(spool_upload, file, storage_path, tmp_dir)
+            uploads.append((storage_path, local_path, file.content_type or "application/pdf"))
+
             uploaded_files.append({
                 "filename": file.filename,
                 "storage_path": storage_path
             })
-            print(f"File saved to Supabase: {storage_path}")
         except Exception as e:
             errors.append(f"{file.filename}: {str(e)}")
         finally:
             file.file.close()
-    print("files uploaded")         
-    if not storage_paths:
-        # Rollback chat creation since no files uploaded successfully
-        db.delete(newchat)
-        db.commit()
+    print("files received")
+    if not uploads:
+        # Rollback chat creation since no files could be read
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        await db.delete(newchat)
+        await db.commit()
         raise HTTPException(status_code=400, detail=f"Failed to upload files. Errors: {', '.join(errors)}")
 
     # Update chat_fileloc with the directory in Supabase (which is just the chat_id)
     newchat.chat_fileloc = str(chat_id)
-    db.commit()
+    await db.commit()
     
-    # Process files
-    tmp_dir = None
+    # The durable copy goes to storage right away, not when an ingest worker
+    # gets to the job: a queued job only has the files in tmp_dir and memory
+    storage_uploads = start_chat_uploads(uploads)
+
+    # Parse + embed + insert in the background; the client polls /ingest/{job_id}
+    job = IngestJob(
+        chat_id=chat_id,
+        user_id=user.user_id,
+        storage_paths=[storage_path for storage_path, _, _ in uploads],
+        files_total=len(uploads),
+    )
+    await submit_job(job, partial(run_ingest_job, uploads=uploads, tmp_dir=tmp_dir, storage_uploads=storage_uploads))
+
+    return {
+        "message": f"Uploaded {len(uploads)} file(s), processing started",
+        "files": uploaded_files,
+        "chat_id": chat_id,
+        "chat_name": chat_name,
+        "job_id": job.job_id,
+        "errors": errors if errors else None
+    }
+
+
+async def run_ingest_job(job: IngestJob, uploads: list, tmp_dir: Path, storage_uploads: asyncio.Future):
+    """
+    Load the files into the vector store while their storage uploads (started
+    by `upload_pdfs`) finish, then report the upload results on the job.
+
+    Parsing reads the local copies in `tmp_dir`; storage is only the durable copy,
+    so a failed storage upload is reported on the job without stopping ingestion.
+    """
     try:
-        tmp_dir = download_for_processing(storage_paths)
-        print("downloaded done and processing started")
-        await add_vector_to_db(chat_id, tmp_dir, db)
-        
-        return {
-            "message": f"Successfully uploaded and processed {len(storage_paths)} file(s)",
-            "files": uploaded_files,
-            "chat_id": chat_id,
-            "chat_name": chat_name,
-            "errors": errors if errors else None
-        }
-    except Exception as e:
-        print(e)
-        return {
-            "message": f"Files uploaded but vector store update failed: {str(e)}",
-            "files": uploaded_files,
-            "chat_id": chat_id,
-            "chat_name": chat_name,
-            "errors": errors
-        }
+        await add_vector_to_db(job.chat_id, tmp_dir, sessionLocal(), job)
     finally:
+        # tmp_dir is only removed once the uploads have read their files
+        await asyncio.wait([storage_uploads])
+        if storage_uploads.cancelled():  # not finished before shutdown
+            results = [RuntimeError("server shut down first")] * len(uploads)
+        else:
+            results = storage_uploads.result()
+        for (storage_path, _, _), result in zip(uploads, results):
+            if isinstance(result, Exception):
+                job.errors.append(f"{storage_path}: storage upload failed: {result}")
+            else:
+                print(f"File saved to Supabase: {storage_path}")
         # Clean up temporary directory
-        if tmp_dir and tmp_dir.exists():
-            shutil.rmtree(tmp_dir)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@router.get("/ingest/{job_id}", response_model=IngestJobStatus)
+def ingest_status(job_id: str, user: Annotated[userdataforapi, Depends(get_current_user)]):
+    """Report phase, progress counters and errors of a background ingestion job."""
+    job = get_job(job_id)
+    if not job or job.user_id != user.user_id:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job.to_status()
@@ -1,5 +1,4 @@
 # supabase_client.py
-from supabase import create_client, Client
 import os
 from dotenv import load_dotenv
 
@@ -7,5 +6,3 @@ load_dotenv(override=True)
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_KEY") 
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
\ No newline at end of file
@@ -9,7 +9,7 @@ JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 def generate_token(data: token_payload, expires_delta: timedelta = timedelta(hours=24)):
     """Generate a JWT token with expiration"""
     try:
-        payload = data.model_dump()
+        payload = data.model_dump(exclude_none=True)
         payload["exp"] = datetime.utcnow() + expires_delta
         token = jwt.encode(payload=payload, key=JWT_SECRET, algorithm=JWT_ALGORITHM)
         return token
@@ -0,0 +1,174 @@
+"""
+Prometheus metrics, served at GET /metrics.
+
+  rag_stage_duration_seconds{component, stage}   histogram of every timed stage:
+      chat       ownership_check, answer_cache, agent, store_turn, total (/chat)
+      llm        agent_run, direct_context, direct_run               (get_response)
+      retriever  embed, count, search, exact_fallback, rerank, hydrate (similarityretriver)
+      tool       search_knowledge_base, search_chat_history, generate_citation
+      ingest     parse, embed, insert, total                         (add_vector_to_db)
+  rag_embed_batch_size{kind}                      texts per model forward pass (query / documents)
+  rag_query_embedding_cache_total{result}         request_hit / lru_hit / miss
+  rag_rerank_cache_total{result}                  cross-encoder scores reused (hit) or computed (miss)
+  rag_retrieval_cache_total{result}               cached retrieval results: hit / miss / stale
+  rag_answer_cache_total{result}                  semantic answer cache: hit / miss / stale
+  rag_user_lookup_total{source}                   authenticated user resolved from claims / cache / db
+  rag_db_pool_checkouts_total{engine}             connections handed out by each pool
+  rag_db_pool_connections{engine, state}          checked_out / checked_in / overflow / size
+  rag_startup_seconds{component}                  import, database, embedding_model, storage (utils/startup.py)
+
+Values are per worker process.
+
+Usage:
+    from utils.metrics import stage
+    with stage("retriever", "search"):
+        ...
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from functools import partial
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each stage of chat, retrieval and ingestion",
+    ["component", "stage"],
+    # Agent runs take tens of seconds; index lookups a few milliseconds
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80),
+)
+
+EMBED_BATCH_SIZE = Histogram(
+    "rag_embed_batch_size",
+    "Texts embedded per model forward pass",
+    ["kind"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+RERANK_CACHE = Counter(
+    "rag_rerank_cache",
+    "Cross-encoder (query, chunk) scores served from cache or computed",
+    ["result"],
+)
+
+RETRIEVAL_CACHE = Counter(
+    "rag_retrieval_cache",
+    "Retrieval result cache lookups",
+    ["result"],
+)
+
+ANSWER_CACHE = Counter(
+    "rag_answer_cache",
+    "Semantic answer cache lookups",
+    ["result"],
+)
+
+USER_LOOKUP = Counter(
+    "rag_user_lookup",
+    "Authenticated users resolved from token claims, the user cache or the database",
+    ["source"],
+)
+
+DB_POOL_CHECKOUTS = Counter(
+    "rag_db_pool_checkouts",
+    "Connections checked out of the SQLAlchemy pool",
+    ["engine"],
+)
+
+STARTUP_SECONDS = Gauge(
+    "rag_startup_seconds",
+    "Time each component took to import or initialize at startup",
+    ["component"],
+)
+
+
+@contextmanager
+def stage(component: str, name: str):
+    """Time the enclosed block into rag_stage_duration_seconds (failures included)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(component, name).observe(time.perf_counter() - start)
+
+
+# ── Collectors for state that lives elsewhere ─────────────────────────────────
+
+class _PoolCollector:
+    def __init__(self, engines: dict):
+        self._engines = engines
+
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            "rag_db_pool_connections", "SQLAlchemy pool connections by state", labels=["engine", "state"]
+        )
+        for name, engine in self._engines.items():
+            pool = engine.pool
+            gauge.add_metric([name, "checked_out"], pool.checkedout())
+            gauge.add_metric([name, "checked_in"], pool.checkedin())
+            gauge.add_metric([name, "overflow"], max(0, pool.overflow()))
+            gauge.add_metric([name, "size"], pool.size())
+        yield gauge
+
+
+class _QueryCacheCollector:
+    def __init__(self, cache):
+        self._cache = cache
+
+    def collect(self):
+        counter = CounterMetricFamily(
+            "rag_query_embedding_cache", "Query embedding cache lookups", labels=["result"]
+        )
+        counter.add_metric(["request_hit"], self._cache.request_hits)
+        counter.add_metric(["lru_hit"], self._cache.lru_hits)
+        counter.add_metric(["miss"], self._cache.misses)
+        yield counter
+
+
+# Registered once per process; the lifespan may run more than once (tests, load-test app)
+_pool_engines: dict = {}
+_pool_collector: Optional[_PoolCollector] = None
+_cache_collector: Optional[_QueryCacheCollector] = None
+
+
+def _count_checkout(name: str, *_) -> None:
+    DB_POOL_CHECKOUTS.labels(name).inc()
+
+
+def register_pool_metrics(engines: dict) -> None:
+    """
+    Export pool state and count checkouts for {label: Engine or AsyncEngine}.
+    Idempotent: each engine gets one checkout listener and the collector is
+    registered once.
+    """
+    global _pool_collector
+    for name, engine in engines.items():
+        engine = getattr(engine, "sync_engine", engine)
+        if _pool_engines.get(name) is engine:
+            continue
+        _pool_engines[name] = engine
+        event.listen(engine, "checkout", partial(_count_checkout, name))
+    if _pool_collector is None:
+        _pool_collector = _PoolCollector(_pool_engines)
+        REGISTRY.register(_pool_collector)
+
+
+def register_cache_metrics(cache) -> None:
+    """Export the query-embedding cache counters; idempotent like register_pool_metrics."""
+    global _cache_collector
+    if _cache_collector is None:
+        _cache_collector = _QueryCacheCollector(cache)
+        REGISTRY.register(_cache_collector)
+    else:
+        _cache_collector._cache = cache
+
+
+def render() -> tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,12 +1,34 @@
-from fastapi import Header,HTTPException,status,Depends
-from sqlalchemy.orm import Session
+from fastapi import Header,HTTPException,status
+from sqlalchemy import select
 from typing import Annotated,Union
-from db.config import init_db
+from db.database import asyncSessionLocal
 from .jwt import verify_token
+from .user_cache import user_cache
+from .metrics import USER_LOOKUP
 from models.pymodel import token_payload,userdataforapi
 from db.data_models import Users
+
+async def _load_user(user_id: int) -> Union[userdataforapi, None]:
+    """Users row as userdataforapi, through the user cache; None if it no longer exists."""
+    cached = user_cache.get(user_id)
+    if cached:
+        USER_LOOKUP.labels("cache").inc()
+        return cached
+    USER_LOOKUP.labels("db").inc()
+    # Own short session: a cache hit (or claims) must not check out a connection
+    async with asyncSessionLocal() as db:
+        user = await db.scalar(select(Users).where(Users.user_id==user_id))
+    if not user:
+        return None
+    userData = userdataforapi(
+        user_id=user.user_id,
+        user_name=user.user_name,
+        email=user.email
+    )
+    user_cache.put(userData)
+    return userData
+
 async def get_current_user(
-        db:Annotated[Session,Depends(init_db)],
         authorization:Annotated[Union[str,None],Header(...)]):
     try:
         auth_exception = HTTPException(
@@ -21,13 +43,17 @@ async def get_current_user(
         data:token_payload = verify_token(token=usertoken)
         if not data:
             raise Exception("Token verification failed")
-        user = db.query(Users).filter(Users.user_id==data.userid).first()
-        userData = userdataforapi(
-            user_id=user.user_id,
-            user_name=user.user_name,
-            email=user.email
-        )
-        print("get user data succesfully")
+        # Tokens issued since profile claims were added carry everything we need
+        if data.user_name and data.email:
+            USER_LOOKUP.labels("claims").inc()
+            return userdataforapi(
+                user_id=data.userid,
+                user_name=data.user_name,
+                email=data.email
+            )
+        userData = await _load_user(data.userid)
+        if not userData:
+            raise auth_exception
         return userData
     except HTTPException as e:
         raise
@@ -36,4 +62,4 @@ async def get_current_user(
         raise HTTPException(
             status_code=500,
             detail="Internal server error"
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,89 @@
+"""
+Startup sequencing, timing and readiness.
+
+main.py's lifespan starts the heavy components in the background and in
+parallel, so the server accepts connections (and answers /health) at once:
+
+  - database        : create missing tables, then check out a connection
+                      from the async pool
+  - embedding_model : load the embedding model and run a warm-up embed
+  - storage         : build the object storage client
+
+Each component's wall time, and the time spent importing main.py, is
+printed, exported as rag_startup_seconds{component} and listed by /ready.
+The retrieval indexes are built in the background too, but are not a
+component: readiness never waits for an index build (timed as "indexes").
+GET /ready answers 200 only once every component has started, the model is
+loaded and the database answers a ping; until then it answers 503.
+
+Usage:
+    startup.record("import", seconds)
+    await startup.run({"database": prepare_database, ...})
+    status = await startup.status(checks)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import time
+from typing import Any, Awaitable, Callable
+
+from utils.metrics import STARTUP_SECONDS
+
+READY_CHECK_TIMEOUT = 2.0
+
+
+class Startup:
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+        self.pending: set[str] = set()
+
+    def record(self, component: str, seconds: float) -> None:
+        self.timings[component] = round(seconds, 3)
+        STARTUP_SECONDS.labels(component).set(seconds)
+        print(f"startup: {component} took {seconds:.2f}s")
+
+    async def _start(self, component: str, init: Callable[[], Awaitable[None]]) -> None:
+        start = time.perf_counter()
+        try:
+            await init()
+        except Exception as e:
+            self.errors[component] = str(e)
+            print(f"Warning: startup of {component} failed: {e}")
+        finally:
+            self.pending.discard(component)
+            self.record(component, time.perf_counter() - start)
+
+    async def run(self, components: dict[str, Callable[[], Awaitable[None]]]) -> None:
+        """Initialize every component concurrently; failures are recorded, not raised."""
+        self.pending.update(components)
+        start = time.perf_counter()
+        await asyncio.gather(*(self._start(name, init) for name, init in components.items()))
+        self.record("total", time.perf_counter() - start)
+
+    async def status(self, checks: dict[str, Callable[[], Any]]) -> dict:
+        """
+        Readiness: startup finished without errors and every live check passes
+        now. A check returns a bool or an awaitable of one.
+        """
+        results = {}
+        for name, check in checks.items():
+            try:
+                result = check()
+                if inspect.isawaitable(result):
+                    result = await asyncio.wait_for(result, READY_CHECK_TIMEOUT)
+                results[name] = bool(result)
+            except Exception:
+                results[name] = False
+        return {
+            "ready": not self.pending and not self.errors and all(results.values()),
+            "checks": results,
+            "pending": sorted(self.pending),
+            "errors": self.errors,
+            "startup_seconds": self.timings,
+        }
+
+
+startup = Startup()
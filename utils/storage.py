@@ -0,0 +1,234 @@
+"""
+Async object storage for chat documents.
+
+The Supabase Python client is synchronous, so calling it from async routes
+blocked the event loop on every storage round trip. This module talks to the
+Supabase Storage REST API through one pooled `httpx.AsyncClient` instead,
+using the project URL and service key from `supabase/supabase_client.py`.
+
+Every backend:
+  - bounds concurrent operations with a semaphore (STORAGE_CONCURRENCY, default 8)
+  - retries transport errors, 429 and 5xx responses with exponential backoff
+    (STORAGE_RETRIES, default 3; STORAGE_BACKOFF seconds, default 0.5)
+
+STORAGE_BACKEND selects the implementation:
+  - supabase (default) : Supabase Storage over HTTP
+  - local              : files under LOCAL_STORAGE_DIR, for tests and benchmarks
+
+Usage:
+    from utils.storage import get_storage
+    storage = get_storage()
+    await storage.upload("12/abc.pdf", data, "application/pdf")
+    files = await storage.list("12")
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import sys
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+BUCKET = "chat-documents"
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+STORAGE_CONCURRENCY = int(os.getenv("STORAGE_CONCURRENCY", "8"))
+STORAGE_MAX_CONNECTIONS = int(os.getenv("STORAGE_MAX_CONNECTIONS", "20"))
+STORAGE_TIMEOUT = float(os.getenv("STORAGE_TIMEOUT", "30"))
+STORAGE_RETRIES = int(os.getenv("STORAGE_RETRIES", "3"))
+STORAGE_BACKOFF = float(os.getenv("STORAGE_BACKOFF", "0.5"))
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", ".local_storage")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class StorageError(Exception):
+    """A storage operation failed (after retries)."""
+
+
+class StorageBackend(ABC):
+    """Common interface; paths are relative to the chat-documents bucket."""
+
+    def __init__(self, concurrency: int):
+        self._limit = asyncio.Semaphore(max(1, concurrency))
+
+    @abstractmethod
+    async def upload(self, path: str, data: bytes, content_type: str) -> str:
+        ...
+
+    @abstractmethod
+    async def download(self, path: str) -> bytes:
+        ...
+
+    @abstractmethod
+    async def list(self, prefix: str) -> list[dict]:
+        """Return [{"name": ..., "metadata": {"size": ...}}, ...] for files under prefix."""
+
+    @abstractmethod
+    async def remove(self, paths: list[str]) -> None:
+        ...
+
+    @abstractmethod
+    async def create_signed_url(self, path: str, expires_in: int) -> str:
+        ...
+
+    async def aclose(self) -> None:
+        pass
+
+
+# ── Supabase ──────────────────────────────────────────────────────────────────
+
+class SupabaseStorage(StorageBackend):
+    def __init__(self, url: str, key: str, concurrency: int):
+        super().__init__(concurrency)
+        self._base_url = f"{url.rstrip('/')}/storage/v1"
+        self._client = httpx.AsyncClient(
+            base_url=self._base_url,
+            headers={"Authorization": f"Bearer {key}", "apikey": key},
+            limits=httpx.Limits(
+                max_connections=STORAGE_MAX_CONNECTIONS,
+                max_keepalive_connections=STORAGE_MAX_CONNECTIONS,
+            ),
+            timeout=STORAGE_TIMEOUT,
+        )
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self._limit:
+            for attempt in range(STORAGE_RETRIES + 1):
+                try:
+                    response = await self._client.request(method, url, **kwargs)
+                    if response.status_code not in RETRY_STATUSES:
+                        break
+                    error = StorageError(f"{method} {url}: HTTP {response.status_code} {response.text}")
+                except httpx.TransportError as e:
+                    error = StorageError(f"{method} {url}: {e}")
+                if attempt == STORAGE_RETRIES:
+                    raise error
+                await asyncio.sleep(STORAGE_BACKOFF * 2 ** attempt)
+
+        if response.is_error:
+            raise StorageError(f"{method} {url}: HTTP {response.status_code} {response.text}")
+        return response
+
+    async def upload(self, path: str, data: bytes, content_type: str) -> str:
+        await self._request(
+            "POST", f"/object/{BUCKET}/{path}",
+            content=data,
+            headers={"content-type": content_type, "x-upsert": "false"},
+        )
+        return path
+
+    async def download(self, path: str) -> bytes:
+        response = await self._request("GET", f"/object/{BUCKET}/{path}")
+        return response.content
+
+    async def list(self, prefix: str) -> list[dict]:
+        response = await self._request(
+            "POST", f"/object/list/{BUCKET}",
+            json={"prefix": prefix, "limit": 1000, "offset": 0,
+                  "sortBy": {"column": "name", "order": "asc"}},
+        )
+        return response.json()
+
+    async def remove(self, paths: list[str]) -> None:
+        if paths:
+            await self._request("DELETE", f"/object/{BUCKET}", json={"prefixes": paths})
+
+    async def create_signed_url(self, path: str, expires_in: int) -> str:
+        response = await self._request(
+            "POST", f"/object/sign/{BUCKET}/{path}", json={"expiresIn": expires_in}
+        )
+        signed = response.json().get("signedURL")
+        if not signed:
+            raise StorageError(f"No signed URL returned for {path}")
+        return f"{self._base_url}/{signed.lstrip('/')}"
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+# ── Local filesystem stand-in ─────────────────────────────────────────────────
+
+class LocalStorage(StorageBackend):
+    """Stores objects under a local directory; signed URLs are file:// URIs."""
+
+    def __init__(self, root: str, concurrency: int):
+        super().__init__(concurrency)
+        self._root = (Path(root) / BUCKET).resolve()
+
+    def _path(self, path: str) -> Path:
+        full = (self._root / path).resolve()
+        if self._root not in full.parents:
+            raise StorageError(f"Invalid storage path: {path}")
+        return full
+
+    def _write(self, path: str, data: bytes) -> None:
+        full = self._path(path)
+        full.parent.mkdir(parents=True, exist_ok=True)
+        full.write_bytes(data)
+
+    def _list(self, prefix: str) -> list[dict]:
+        folder = self._root / prefix
+        if not folder.is_dir():
+            return []
+        return [
+            {"name": f.name, "metadata": {"size": f.stat().st_size}}
+            for f in sorted(folder.iterdir()) if f.is_file()
+        ]
+
+    async def upload(self, path: str, data: bytes, content_type: str) -> str:
+        async with self._limit:
+            await asyncio.to_thread(self._write, path, data)
+        return path
+
+    async def download(self, path: str) -> bytes:
+        async with self._limit:
+            try:
+                return await asyncio.to_thread(self._path(path).read_bytes)
+            except FileNotFoundError as e:
+                raise StorageError(f"Object not found: {path}") from e
+
+    async def list(self, prefix: str) -> list[dict]:
+        async with self._limit:
+            return await asyncio.to_thread(self._list, prefix)
+
+    async def remove(self, paths: list[str]) -> None:
+        async with self._limit:
+            for path in paths:
+                await asyncio.to_thread(self._path(path).unlink, True)
+
+    async def create_signed_url(self, path: str, expires_in: int) -> str:
+        full = self._path(path)
+        if not full.is_file():
+            raise StorageError(f"Object not found: {path}")
+        return full.as_uri()
+
+
+# ── Singleton ─────────────────────────────────────────────────────────────────
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalStorage(LOCAL_STORAGE_DIR, STORAGE_CONCURRENCY)
+        elif STORAGE_BACKEND == "supabase":
+            sys.path.append(str(Path(__file__).resolve().parent.parent / "supabase"))
+            from supabase_client import SUPABASE_URL, SUPABASE_SERVICE_KEY
+            _storage = SupabaseStorage(SUPABASE_URL, SUPABASE_SERVICE_KEY, STORAGE_CONCURRENCY)
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND!r}")
+    return _storage
+
+
+async def close_storage() -> None:
+    global _storage
+    if _storage is not None:
+        await _storage.aclose()
+        _storage = None
@@ -1,33 +1,52 @@
 from fastapi import UploadFile
-from typing import List
 from pathlib import Path
+import asyncio
+import os
+import shutil
 import uuid
-import tempfile
-import sys
+from utils.storage import get_storage
 
-# Safely import supabase without local namespace shadowing issues
-sys.path.append(str(Path(__file__).resolve().parent.parent / "supabase"))
-from supabase_client import supabase
+# Seconds a graceful shutdown waits for durable uploads still in flight
+STORAGE_DRAIN_TIMEOUT = float(os.getenv("STORAGE_DRAIN_TIMEOUT", "30"))
 
-def upload_chat_file(chat_id: int, file: UploadFile) -> str:
-    file_ext = file.filename.split(".")[-1]
-    storage_path = f"{chat_id}/{uuid.uuid4()}.{file_ext}"
+# Durable uploads started by requests and not finished yet, with their storage paths
+_pending_uploads: dict[asyncio.Future, list[str]] = {}
 
+def new_storage_path(chat_id: int, filename: str) -> str:
+    file_ext = filename.split(".")[-1]
+    return f"{chat_id}/{uuid.uuid4()}.{file_ext}"
+
+def spool_upload(file: UploadFile, storage_path: str, tmp_dir: Path) -> Path:
+    """Copy an uploaded file into the job's working dir so ingestion can parse it locally."""
+    local_path = tmp_dir / Path(storage_path).name
     file.file.seek(0)
-    file_bytes = file.file.read()
+    with local_path.open("wb") as out:
+        shutil.copyfileobj(file.file, out)
+    return local_path
 
-    supabase.storage.from_("chat-documents").upload(
-        path=storage_path,
-        file=file_bytes,
-        file_options={"content-type": file.content_type},
-    )
+async def upload_chat_file(storage_path: str, local_path: Path, content_type: str) -> str:
+    """Store the durable copy of an uploaded file in object storage."""
+    file_bytes = await asyncio.to_thread(local_path.read_bytes)
+    return await get_storage().upload(storage_path, file_bytes, content_type)
 
-    return storage_path
+def start_chat_uploads(uploads: list) -> asyncio.Future:
+    """
+    Start the durable uploads of (storage_path, local_path, content_type) files.
+    The returned future resolves to one result or exception per file; it is
+    tracked until done so shutdown can wait for it (`drain_uploads`).
+    """
+    future = asyncio.gather(*[upload_chat_file(*upload) for upload in uploads], return_exceptions=True)
+    _pending_uploads[future] = [storage_path for storage_path, _, _ in uploads]
+    future.add_done_callback(lambda done: _pending_uploads.pop(done, None))
+    return future
 
-def download_for_processing(storage_paths: List[str]) -> Path:
-    tmp_dir = Path(tempfile.mkdtemp())
-    for storage_path in storage_paths:
-        file_bytes = supabase.storage.from_("chat-documents").download(storage_path)
-        local_path = tmp_dir / Path(storage_path).name
-        local_path.write_bytes(file_bytes)
-    return tmp_dir
+async def drain_uploads(timeout: float = STORAGE_DRAIN_TIMEOUT) -> None:
+    """Wait for in-flight durable uploads before the storage client closes."""
+    if not _pending_uploads:
+        return
+    print(f"waiting for {len(_pending_uploads)} storage upload(s)")
+    _, unfinished = await asyncio.wait(list(_pending_uploads), timeout=timeout)
+    for future in unfinished:
+        for storage_path in _pending_uploads.get(future, []):
+            print(f"Warning: storage upload of {storage_path} did not finish before shutdown")
+        future.cancel()
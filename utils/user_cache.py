@@ -0,0 +1,95 @@
+"""
+Cache of authenticated users' profiles.
+
+`get_current_user` used to load the Users row on every authenticated request
+just to rebuild `userdataforapi`. Tokens issued now carry user_name and email
+as signed claims, so they need no lookup at all. Older tokens (user id only)
+are resolved through this bounded LRU (USER_CACHE_SIZE entries, default
+4096; 0 disables) whose entries expire after USER_CACHE_TTL seconds
+(default 300).
+
+Any flush that updates or deletes a Users row evicts that user once the
+transaction commits, so this worker never serves a changed profile; the TTL
+bounds staleness from changes made by other worker processes. Claims in an
+already-issued token reflect the user as of login.
+
+Lookups are counted in rag_user_lookup_total{source} (claims / cache / db).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db.data_models import Users
+from models.pymodel import userdataforapi
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+
+class UserCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple[float, userdataforapi]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[userdataforapi]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            stored_at, user = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def put(self, user: userdataforapi) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[user.user_id] = (time.monotonic(), user)
+            self._entries.move_to_end(user.user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids) -> None:
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+# ── Invalidation on user changes ──────────────────────────────────────────────
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session: Session, flush_context) -> None:
+    changed = {
+        obj.user_id for obj in (*session.dirty, *session.deleted)
+        if isinstance(obj, Users) and obj.user_id is not None
+    }
+    if changed:
+        session.info.setdefault("changed_users", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_changed_users(session: Session) -> None:
+    user_ids = session.info.pop("changed_users", None)
+    if user_ids:
+        user_cache.invalidate(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session: Session) -> None:
+    session.info.pop("changed_users", None)